@@ -3,7 +3,7 @@ set -e
 
 if [ ! -e venv ]; then
     python -m venv venv
-    venv/bin/python -m pip install -e .[pygame]
+    venv/bin/python -m pip install -e .[assets,pygame]
 fi
 
 app=$1
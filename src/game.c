@@ -1,5 +1,6 @@
 #include <malloc.h>
 #include <stdbool.h>
+#include <string.h>
 
 #include <libdragon.h>
 
@@ -12,6 +13,11 @@
 // IN to host
 enum {
     GAME_IN_INPUT,
+    GAME_IN_RESIDENT,
+    GAME_IN_EVICT,
+    GAME_IN_VBLANK,
+    GAME_IN_STATE,
+    GAME_IN_SDRAM,
 };
 
 // OUT from host
@@ -21,14 +27,36 @@ enum {
     GAME_OUT_BACKGROUND,
     GAME_OUT_SPRITE,
     GAME_OUT_ENTITY,
+    GAME_OUT_BLOB,
+    GAME_OUT_BIND,
+    GAME_OUT_SDRAM,
+    GAME_OUT_VBLANK,
+    GAME_OUT_FRAME,
+    GAME_OUT_RESUME,
 };
 
+// SDRAM as seen through the PI bus
+#define CART_SDRAM_BASE 0x10000000
+
+typedef struct {
+    uint8_t hash[8];
+    uint32_t length;
+    uint32_t received;
+    void *buf;
+} blob_t;
+
 static void joypad_task(void);
 static void game_out_reset_message(size_t length);
 static void game_out_ready_message(size_t length);
 static void game_out_background_message(size_t length);
 static void game_out_sprite_message(size_t length);
 static void game_out_entity_message(size_t length);
+static void game_out_blob_message(size_t length);
+static void game_out_bind_message(size_t length);
+static void game_out_sdram_message(size_t length);
+static void game_out_vblank_message(size_t length);
+static void game_out_frame_message(size_t length);
+static void game_out_resume_message(size_t length);
 
 usb_message_handler_t message_handlers[] = {
     [GAME_OUT_RESET]        = game_out_reset_message,
@@ -36,13 +64,25 @@ usb_message_handler_t message_handlers[] = {
     [GAME_OUT_BACKGROUND]   = game_out_background_message,
     [GAME_OUT_SPRITE]       = game_out_sprite_message,
     [GAME_OUT_ENTITY]       = game_out_entity_message,
+    [GAME_OUT_BLOB]         = game_out_blob_message,
+    [GAME_OUT_BIND]         = game_out_bind_message,
+    [GAME_OUT_SDRAM]        = game_out_sdram_message,
+    [GAME_OUT_VBLANK]       = game_out_vblank_message,
+    [GAME_OUT_FRAME]        = game_out_frame_message,
+    [GAME_OUT_RESUME]       = game_out_resume_message,
 };
 
 static color_t background;
 static void *sprites_buf[256];
 static sprite_t *sprites[256];
+static blob_t *sprite_blobs[256];
+static blob_t blobs[256];
 static entity_t *entities[1024];
 static bool waiting_for_host;
+static bool vblank_signal;
+static uint32_t frame_count;
+static uint32_t session;
+static uint32_t sequence;
 
 void game_setup(void)
 {
@@ -69,6 +109,12 @@ void game_loop(void)
 {
     surface_t *disp = display_get();
 
+    // display_get returns once a buffer is free, once per displayed frame
+    frame_count++;
+    if (vblank_signal) {
+        queue_usb_message(GAME_IN_VBLANK, &frame_count, sizeof(frame_count));
+    }
+
     rdpq_attach(disp, NULL);
     rdpq_clear(background);
 
@@ -179,18 +225,115 @@ static void joypad_task(void)
     inputs_last = inputs;
 }
 
+static blob_t *blob_find(const uint8_t *hash)
+{
+    for (int i = 0; i < _countof(blobs); i++) {
+        if (blobs[i].buf &&
+                !memcmp(blobs[i].hash, hash, sizeof(blobs[i].hash))) {
+            return &blobs[i];
+        }
+    }
+    return NULL;
+}
+
+static bool blob_bound(const blob_t *blob)
+{
+    for (int i = 0; i < _countof(sprite_blobs); i++) {
+        if (sprite_blobs[i] == blob) {
+            return true;
+        }
+    }
+    return false;
+}
+
+static void blob_free(blob_t *blob)
+{
+    free(blob->buf);
+    blob->buf = NULL;
+    blob->length = 0;
+    blob->received = 0;
+}
+
+static blob_t *blob_alloc(const uint8_t *hash, uint32_t length)
+{
+    blob_t *blob = NULL;
+
+    for (int i = 0; i < _countof(blobs); i++) {
+        if (!blobs[i].buf) {
+            blob = &blobs[i];
+            break;
+        }
+    }
+
+    if (!blob) {
+        for (int i = 0; i < _countof(blobs); i++) {
+            if (!blob_bound(&blobs[i])) {
+                blob = &blobs[i];
+                queue_usb_message(GAME_IN_EVICT, blob->hash, sizeof(blob->hash));
+                blob_free(blob);
+                break;
+            }
+        }
+    }
+
+    if (!blob) {
+        return NULL;
+    }
+
+    blob->buf = malloc(length);
+    if (!blob->buf) {
+        return NULL;
+    }
+    memcpy(blob->hash, hash, sizeof(blob->hash));
+    blob->length = length;
+    blob->received = 0;
+    return blob;
+}
+
+static void sprite_free(int i)
+{
+    sprites[i] = NULL;
+    sprite_blobs[i] = NULL;
+    free(sprites_buf[i]);
+    sprites_buf[i] = NULL;
+}
+
 static void game_out_reset_message(size_t length)
 {
+    static uint8_t resident[_countof(blobs)][8];
+    size_t count = 0;
+    struct {
+        uint32_t session;
+    } pkt = { 0 };
+
+    if (length >= sizeof(pkt)) {
+        usb_messages_read(&pkt, sizeof(pkt));
+        usb_messages_skip(length - sizeof(pkt));
+    }
+    session = pkt.session;
+    sequence = 0;
+
     waiting_for_host = true;
 
     background = RGBA32(0x17, 0x17, 0x17, 0xff);
 
     for (int i = 0; i < _countof(sprites_buf); i++) {
-        sprites[i] = NULL;
-        free(sprites_buf[i]);
-        sprites_buf[i] = NULL;
+        sprite_free(i);
     }
 
+    // complete blobs survive a reset, tell the host which ones we kept
+    for (int i = 0; i < _countof(blobs); i++) {
+        if (!blobs[i].buf) {
+            continue;
+        }
+        if (blobs[i].received < blobs[i].length) {
+            blob_free(&blobs[i]);
+            continue;
+        }
+        memcpy(resident[count++], blobs[i].hash, sizeof(blobs[i].hash));
+    }
+    queue_usb_message(GAME_IN_RESIDENT, resident, count * sizeof(resident[0]));
+
     for (int i = 0; i < _countof(entities); i++) {
         free(entities[i]);
         entities[i] = NULL;
@@ -226,9 +369,7 @@ static void game_out_sprite_message(size_t length)
     }
 
     if (sprite_len == 0) {
-        sprites[pkt.i] = NULL;
-        free(sprites_buf[pkt.i]);
-        sprites_buf[pkt.i] = NULL;
+        sprite_free(pkt.i);
         return;
     } else {
         void *p = realloc(sprites_buf[pkt.i], sprite_len);
@@ -241,6 +382,67 @@ static void game_out_sprite_message(size_t length)
 
     usb_messages_read(sprites_buf[pkt.i], sprite_len);
     sprites[pkt.i] = sprite_load_buf(sprites_buf[pkt.i], sprite_len);
+    sprite_blobs[pkt.i] = NULL;
+}
+
+static void game_out_blob_message(size_t length)
+{
+    struct __packed {
+        uint8_t hash[8];
+        uint32_t length;
+        uint32_t offset;
+    } pkt;
+
+    usb_messages_read(&pkt, sizeof(pkt));
+    uint32_t chunk_len = length - sizeof(pkt);
+
+    blob_t *blob = blob_find(pkt.hash);
+    if (blob && blob->length != pkt.length) {
+        if (blob_bound(blob)) {
+            usb_messages_skip(chunk_len);
+            return;
+        }
+        blob_free(blob);
+        blob = NULL;
+    }
+    if (!blob) {
+        blob = blob_alloc(pkt.hash, pkt.length);
+    }
+    if (!blob || pkt.offset + chunk_len > blob->length) {
+        queue_usb_message(GAME_IN_EVICT, pkt.hash, sizeof(pkt.hash));
+        usb_messages_skip(chunk_len);
+        return;
+    }
+
+    // an upload restarting from the top replaces whatever was received
+    if (pkt.offset == 0) {
+        blob->received = 0;
+    }
+    usb_messages_read((uint8_t *) blob->buf + pkt.offset, chunk_len);
+    blob->received += chunk_len;
+}
+
+static void game_out_bind_message(size_t length)
+{
+    struct __packed {
+        uint16_t i;
+        uint8_t hash[8];
+    } pkt;
+
+    usb_messages_read(&pkt, sizeof(pkt));
+    if (pkt.i >= _countof(sprites)) {
+        return;
+    }
+
+    sprite_free(pkt.i);
+    blob_t *blob = blob_find(pkt.hash);
+    if (!blob || blob->received < blob->length) {
+        queue_usb_message(GAME_IN_EVICT, pkt.hash, sizeof(pkt.hash));
+        return;
+    }
+
+    sprites[pkt.i] = sprite_load_buf(blob->buf, blob->length);
+    sprite_blobs[pkt.i] = blob;
 }
 
 static void game_out_entity_message(size_t length)
@@ -275,3 +477,65 @@ static void game_out_entity_message(size_t length)
         usb_messages_skip(entity_len);
     }
 }
+
+static void game_out_sdram_message(size_t length)
+{
+    struct __packed {
+        uint8_t hash[8];
+        uint32_t length;
+        uint32_t address;
+    } pkt;
+
+    usb_messages_read(&pkt, sizeof(pkt));
+
+    blob_t *blob = blob_find(pkt.hash);
+    if (blob && blob->length != pkt.length && !blob_bound(blob)) {
+        blob_free(blob);
+        blob = NULL;
+    }
+    if (!blob) {
+        blob = blob_alloc(pkt.hash, pkt.length);
+    }
+    if (!blob || blob->length != pkt.length) {
+        queue_usb_message(GAME_IN_EVICT, pkt.hash, sizeof(pkt.hash));
+        return;
+    }
+
+    dma_read(blob->buf, CART_SDRAM_BASE + pkt.address, pkt.length);
+    blob->received = pkt.length;
+    // the host may now reuse the staging range
+    queue_usb_message(GAME_IN_SDRAM, pkt.hash, sizeof(pkt.hash));
+}
+
+static void game_out_vblank_message(size_t length)
+{
+    struct {
+        uint8_t enable;
+    } pkt;
+
+    usb_messages_read(&pkt, sizeof(pkt));
+    vblank_signal = pkt.enable;
+}
+
+static void game_out_frame_message(size_t length)
+{
+    struct {
+        uint32_t sequence;
+    } pkt;
+
+    usb_messages_read(&pkt, sizeof(pkt));
+    sequence = pkt.sequence;
+}
+
+static void game_out_resume_message(size_t length)
+{
+    struct __packed {
+        uint32_t session;
+        uint32_t sequence;
+    } pkt = {
+        .session = session,
+        .sequence = sequence,
+    };
+
+    queue_usb_message(GAME_IN_STATE, &pkt, sizeof(pkt));
+}
@@ -1,38 +1,76 @@
-from .util import vlq_pack, vlq_unpack
+from .util import vlq_pack_into, vlq_size, vlq_unpack_from
 
 USB_HEARTBEAT   = 5
 USB_MESSAGES    = 255
 
+MESSAGE_BUFFER_SIZE = 16 * 1024
+
 class Terminal64:
     def __init__(self, cart):
         self.cart = cart
         self.cart.recv_usb_pkt = self.recv_usb_pkt
-        self.message_buffer = bytearray()
+        self._send_buffer = bytearray(MESSAGE_BUFFER_SIZE)
+        self._send_length = 0
         self.usb_pkt_handlers = {
             USB_MESSAGES: self.handle_usb_messages,
         }
+        self.usb_message_handlers = {}
+
+    @property
+    def queued(self):
+        return self._send_length
 
     def recv_usb_pkt(self, packet_type, data):
         handler = self.usb_pkt_handlers.get(packet_type, lambda _: None)
         handler(data)
 
+    """Handlers get a memoryview into the packet, copy it to keep it"""
     def handle_usb_messages(self, data):
-        while data:
-            message_type, length = vlq_unpack(data)
-            del data[:length]
-            message_length, length = vlq_unpack(data)
-            del data[:length]
-            message_data = data[:message_length]
-            self.handle_usb_message(message_type, message_data)
-            del data[:message_length]
+        view = memoryview(data)
+        handlers = self.usb_message_handlers
+        offset = 0
+        while offset < len(view):
+            message_type, offset = vlq_unpack_from(view, offset)
+            message_length, offset = vlq_unpack_from(view, offset)
+            message_data = view[offset:offset + message_length]
+            offset += message_length
+            handler = handlers.get(message_type)
+            if handler is None:
+                self.handle_usb_message(message_type, message_data)
+            else:
+                handler(message_data)
+
+    def _reserve(self, length):
+        end = self._send_length + length
+        if end > len(self._send_buffer):
+            grow = max(end - len(self._send_buffer), len(self._send_buffer))
+            self._send_buffer.extend(bytes(grow))
+        return end
 
     def queue_usb_message(self, message_type, data=b''):
-        message_header = vlq_pack(message_type) + vlq_pack(len(data))
-        self.message_buffer.extend(message_header + data)
+        length = len(data)
+        end = self._reserve(vlq_size(message_type) + vlq_size(length) + length)
+        offset = vlq_pack_into(self._send_buffer, self._send_length,
+                               message_type)
+        offset = vlq_pack_into(self._send_buffer, offset, length)
+        self._send_buffer[offset:end] = data
+        self._send_length = end
+
+    def queue_usb_raw(self, data):
+        end = self._reserve(len(data))
+        self._send_buffer[self._send_length:end] = data
+        self._send_length = end
 
     def send_usb_messages(self):
-        self.cart.send_usb_cmd(USB_MESSAGES, self.message_buffer)
-        self.message_buffer = bytearray()
+        # the transport keeps a reference until written, hand it a copy
+        with memoryview(self._send_buffer) as view:
+            data = bytes(view[:self._send_length])
+        self._send_length = 0
+        self.cart.send_usb_cmd(USB_MESSAGES, data, merge=True)
+        return data
+
+    async def drain(self):
+        await self.cart.drain_usb()
 
     """User function expected to be monkey patched"""
     def handle_usb_message(self, message_type, data):
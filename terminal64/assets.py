@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import json
+import math
+import os
+from hashlib import blake2b
+from struct import Struct
+
+import click
+
+PIPELINE_VERSION = 1
+
+# tex_format_t code and bytes per pixel
+SPRITE_FORMATS = {
+    'RGBA16': (2, 2),
+    'RGBA32': (3, 4),
+}
+
+sprite_header = Struct('>HHBBBB')
+
+def _open(path):
+    from PIL import Image
+    return Image.open(path).convert('RGBA')
+
+def _pixels(image, format):
+    rgba = image.tobytes()
+    if format == 'RGBA32':
+        return rgba
+    out = bytearray(len(rgba) // 2)
+    for i in range(0, len(rgba), 4):
+        r, g, b, a = rgba[i:i + 4]
+        value = (r >> 3 << 11) | (g >> 3 << 6) | (b >> 3 << 1) | (a >> 7)
+        out[i // 2:i // 2 + 2] = value.to_bytes(2)
+    return bytes(out)
+
+def convert(image, format='RGBA16', tiles=None):
+    if format not in SPRITE_FORMATS:
+        raise ValueError(f'unsupported sprite format `{format}`')
+    tex_format, bpp = SPRITE_FORMATS[format]
+    width, height = image.size
+    if (width * bpp) % 8:
+        raise ValueError('sprite rows must be a multiple of 8 bytes')
+    tile_width, tile_height = tiles or (width, height)
+    if width % tile_width or height % tile_height:
+        raise ValueError('image size must be a multiple of the tile size')
+    hslices = width // tile_width
+    vslices = height // tile_height
+    if hslices > 255 or vslices > 255:
+        raise ValueError('too many tiles')
+    header = sprite_header.pack(width, height, bpp, tex_format, hslices,
+                                vslices)
+    return header + _pixels(image, format)
+
+def pack_atlas(images, tile=None, columns=None):
+    from PIL import Image
+    tile_width, tile_height = tile or (
+        max(image.size[0] for image in images),
+        max(image.size[1] for image in images),
+    )
+    if columns is None:
+        columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    atlas = Image.new('RGBA', (columns * tile_width, rows * tile_height))
+    for i, image in enumerate(images):
+        if image.size[0] > tile_width or image.size[1] > tile_height:
+            raise ValueError('image larger than the atlas tile')
+        x = i % columns * tile_width
+        y = i // columns * tile_height
+        atlas.paste(image, (x, y))
+    return atlas, (tile_width, tile_height)
+
+class AssetCache:
+    def __init__(self, directory='build/assets'):
+        self.directory = directory
+
+    def _key(self, sources, flags):
+        key = blake2b(digest_size=8)
+        key.update(repr((PIPELINE_VERSION, flags)).encode())
+        for source in sources:
+            with open(source, 'rb') as f:
+                key.update(f.read())
+        return key.hexdigest()
+
+    def _path(self, name, key, ext):
+        return os.path.join(self.directory, f'{name}-{key}{ext}')
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def build(self, source, format='RGBA16', tiles=None):
+        tiles = tuple(tiles) if tiles else None
+        key = self._key([source], (format, tiles))
+        name = os.path.splitext(os.path.basename(source))[0]
+        path = self._path(name, key, '.sprite')
+        if not os.path.exists(path):
+            self._write(path, convert(_open(source), format, tiles))
+        return path
+
+    """Packs sources into one tiled sprite, returns its path and a map of
+    source name to tile index"""
+    def atlas(self, name, sources, format='RGBA16', tile=None, columns=None):
+        tile = tuple(tile) if tile else None
+        key = self._key(sources, (format, tile, columns, list(sources)))
+        path = self._path(name, key, '.sprite')
+        index_path = self._path(name, key, '.json')
+        if not os.path.exists(path) or not os.path.exists(index_path):
+            images = [_open(source) for source in sources]
+            atlas, tile = pack_atlas(images, tile, columns)
+            self._write(path, convert(atlas, format, tile))
+            index = {os.path.splitext(os.path.basename(source))[0]: i
+                     for i, source in enumerate(sources)}
+            self._write(index_path, json.dumps(index, indent=2).encode())
+        with open(index_path) as f:
+            index = json.load(f)
+        return path, index
+
+def _size(value):
+    if value is None:
+        return None
+    width, height = value.split(',')
+    return int(width), int(height)
+
+@click.command
+@click.argument('sources', nargs=-1, required=True)
+@click.option('--format', default='RGBA16', type=click.Choice(SPRITE_FORMATS))
+@click.option('--tiles', help='tile size as WIDTH,HEIGHT')
+@click.option('--atlas', help='pack all sources into one sprite with this name')
+@click.option('--output', default='build/assets', help='cache directory')
+def main(sources, format, tiles, atlas, output):
+    cache = AssetCache(output)
+    if atlas:
+        path, index = cache.atlas(atlas, sources, format, _size(tiles))
+        click.echo(f'{path} {index}')
+    else:
+        for source in sources:
+            click.echo(cache.build(source, format, _size(tiles)))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+from collections import defaultdict, deque
+
+import click
+from serial_asyncio import create_serial_connection
+
+from .sc64 import DATA_COMMANDS, SummerCart64, cmd_header, pkt_header
+
+MUX_SOCKET = '/tmp/terminal64-sc64.sock'
+
+# Clients speak the serial protocol unchanged, plus one SUB frame listing the
+# PKT ids they want ('SUB', '*', 0, length, ids; no ids means all of them).
+class MuxClient(asyncio.Protocol):
+    def __init__(self, cart):
+        self.cart = cart
+        self.subscribe = None
+        self._buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.cart.clients.add(self)
+        if not self.cart._writing.is_set():
+            transport.pause_reading()
+
+    def connection_lost(self, exc):
+        self.cart.clients.discard(self)
+
+    def data_received(self, data):
+        self._buffer += data
+        offset = 0
+        while len(self._buffer) - offset >= cmd_header.size:
+            kind, pkt_id, _, arg1 = cmd_header.unpack_from(self._buffer,
+                                                           offset)
+            pkt_id = chr(pkt_id)
+            length = arg1 if kind == b'SUB' or pkt_id in DATA_COMMANDS else 0
+            end = offset + cmd_header.size + length
+            if len(self._buffer) < end:
+                break
+
+            if kind == b'CMD':
+                self.cart.queue_cmd(self, pkt_id, self._buffer[offset:end])
+            elif kind == b'SUB':
+                ids = self._buffer[offset + cmd_header.size:end].decode()
+                self.subscribe = set(ids) if ids else None
+            else:
+                self.transport.close()
+                return
+            offset = end
+        del self._buffer[:offset]
+
+    def wants(self, pkt_id):
+        return self.subscribe is None or pkt_id in self.subscribe
+
+    def send(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+# Owns the serial port.  Commands from all clients collected during one pass
+# of the event loop go out as a single serial write, and responses are
+# routed back in the order the cart answers them.  While the serial side is
+# backed up, clients are not read from.
+class MuxCart(SummerCart64):
+    def __init__(self):
+        super().__init__()
+        self.clients = set()
+        self._routes = defaultdict(deque)
+        self._out = bytearray()
+        self.stats.update({
+            'client_commands': 0,
+            'serial_writes': 0,
+            'responses_routed': 0,
+            'packets_fanned_out': 0,
+        })
+
+    def queue_cmd(self, client, pkt_id, frame):
+        if not self._out:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._out += frame
+        if pkt_id != 'U':
+            self._routes[pkt_id].append(client)
+        self.stats['client_commands'] += 1
+
+    def pause_writing(self):
+        super().pause_writing()
+        for client in self.clients:
+            client.transport.pause_reading()
+
+    def resume_writing(self):
+        super().resume_writing()
+        for client in self.clients:
+            client.transport.resume_reading()
+
+    def _flush(self):
+        self.transport.write(bytes(self._out))
+        self._out.clear()
+        self.stats['serial_writes'] += 1
+
+    def _cmd_done(self, pkt_id, status, data):
+        routes = self._routes.get(pkt_id)
+        if not routes:
+            return
+        kind = b'CMP' if status else b'ERR'
+        routes.popleft().send(pkt_header.pack(kind, ord(pkt_id), len(data)) +
+                              data)
+        self.stats['responses_routed'] += 1
+
+    def recv_pkt(self, pkt_id, data):
+        frame = None
+        for client in self.clients:
+            if client.wants(pkt_id):
+                if frame is None:
+                    frame = pkt_header.pack(b'PKT', ord(pkt_id),
+                                            len(data)) + data
+                client.send(frame)
+                self.stats['packets_fanned_out'] += 1
+
+    async def reset(self):
+        self._routes.clear()
+        return await super().reset()
+
+async def amain(uart, path):
+    loop = asyncio.get_event_loop()
+    _, cart = await create_serial_connection(loop, MuxCart, uart)
+    await asyncio.wait_for(cart.connected.wait(), 1)
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await loop.create_unix_server(lambda: MuxClient(cart), path)
+    async with server:
+        await server.serve_forever()
+
+@click.command
+@click.argument('uart', default='/dev/ttyUSB0')
+@click.option('--socket', 'path', default=MUX_SOCKET, help='socket to listen on')
+def main(uart, path):
+    try:
+        asyncio.run(amain(uart, path))
+    except KeyboardInterrupt:
+        pass
@@ -1,50 +1,192 @@
 import asyncio
+import os
+import stat
+from collections import defaultdict, deque
+from struct import Struct
 from sys import stderr
+from time import perf_counter
 from serial_asyncio import create_serial_connection
 
-class SummerCart64(asyncio.Protocol):
-    def __init__(self):
+CMD_TIMEOUT = 0.5
+MEMORY_BLOCK_SIZE = 64 * 1024
+MEMORY_WINDOW = 4
+USB_QUEUE_SIZE = 8
+USB_QUEUE_LOW_WATER = 2
+USB_MERGE_SIZE = 64 * 1024
+WRITE_HIGH_WATER = 64 * 1024
+WRITE_LOW_WATER = 16 * 1024
+RECV_BUFFER_SIZE = 256 * 1024
+
+pkt_header = Struct('>3sBI')
+cmd_header = Struct('>3sBII')
+
+# Commands whose arg1 is the length of the data that follows
+DATA_COMMANDS = 'MU'
+
+def is_socket(path):
+    if path.startswith('unix:'):
+        return True
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+# Received bytes land in a fixed bytearray between a read and a write cursor.
+# It is never resized in place, so payload memoryviews handed to callbacks
+# stay valid; unread bytes are moved to the front only when room runs out.
+class SummerCart64(asyncio.BufferedProtocol):
+    def __init__(self, subscribe=None):
         self.connected = asyncio.Event()
+        self.subscribe = subscribe
+        self.muxed = False
+        self.stats = {
+            'memory_write_bytes': 0,
+            'memory_write_seconds': 0.0,
+            'packets_received': 0,
+            'bytes_received': 0,
+            'compactions': 0,
+            'commands': 0,
+            'command_seconds': 0.0,
+            'command_max_seconds': 0.0,
+            'command_timeouts': 0,
+            'usb_writes': 0,
+            'usb_merged': 0,
+            'usb_queue_depth': 0,
+            'usb_queue_max': 0,
+            'usb_write_seconds': 0.0,
+            'usb_write_max_seconds': 0.0,
+            'write_pauses': 0,
+        }
+        self._cmd_pending = defaultdict(deque)
+        self._cmd_seq = 0
+        self._usb_queue = deque()
+        self._usb_queued = asyncio.Event()
+        self._usb_writer = None
+        self._writing = asyncio.Event()
+        self._writing.set()
+        self.usb_writable = asyncio.Event()
+        self.usb_writable.set()
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
 
     def connection_made(self, transport):
         self.transport = transport
-        self._buffer = bytearray()
-        self._cmd_pending = []
+        self.transport.set_write_buffer_limits(WRITE_HIGH_WATER,
+                                               WRITE_LOW_WATER)
+        self._start = 0
+        self._end = 0
+        # a cart multiplexer owns the serial port and its reset lines
+        self.muxed = transport.get_extra_info('serial') is None
+        if self.muxed:
+            ids = (self.subscribe or '').encode()
+            self.transport.write(cmd_header.pack(b'SUB', ord('*'), 0,
+                                                 len(ids)) + ids)
         asyncio.create_task(self.reset())
 
-    def connection_lost(self):
+    def connection_lost(self, exc):
         self.connected.clear()
+        if self._usb_writer is not None:
+            self._usb_writer.cancel()
+            self._usb_writer = None
+
+    def pause_writing(self):
+        self.stats['write_pauses'] += 1
+        self._writing.clear()
+        self.usb_writable.clear()
+
+    def resume_writing(self):
+        self._writing.set()
+        self._update_writable()
+
+    def _make_room(self, length):
+        if len(self._buffer) - self._end >= length:
+            return
+        pending = self._end - self._start
+        if pending + length > len(self._buffer):
+            size = max(len(self._buffer) * 2, pending + length)
+            buffer = bytearray(size)
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        else:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+        self._start = 0
+        self._end = pending
+        self.stats['compactions'] += 1
+
+    def get_buffer(self, sizehint):
+        self._make_room(max(sizehint, MEMORY_BLOCK_SIZE))
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+        self.stats['bytes_received'] += nbytes
+        self._parse()
 
     def data_received(self, data):
-        self._buffer.extend(data)
-        while len(self._buffer) > 8:
-            pkt_type = self._buffer[0:3]
+        self._make_room(len(data))
+        self._view[self._end:self._end + len(data)] = data
+        self.buffer_updated(len(data))
+
+    def _parse(self):
+        while self._end - self._start >= pkt_header.size:
+            pkt_type, pkt_id, data_length = pkt_header.unpack_from(
+                self._buffer, self._start)
             if pkt_type not in (b'CMP', b'ERR', b'PKT'):
                 asyncio.create_task(self.reset())
                 return
 
-            pkt_id = chr(self._buffer[3])
-            data_length = int.from_bytes(self._buffer[4:8])
-            if len(self._buffer) + 8 < data_length:
-                return
+            start = self._start + pkt_header.size
+            if self._end - start < data_length:
+                break
 
-            data = self._buffer[8:8 + data_length]
+            data = self._view[start:start + data_length]
+            self._start = start + data_length
+            self.stats['packets_received'] += 1
+            pkt_id = chr(pkt_id)
             if pkt_type == b'PKT':
                 self.recv_pkt(pkt_id, data)
-            elif pkt_type in (b'CMP', b'ERR'):
-                for pending in self._cmd_pending:
-                    if pending['pkt_id'] == pkt_id:
-                        self._cmd_pending.remove(pending)
-                        pending['status'] = pkt_type == b'CMP'
-                        pending['data'] = data
-                        pending['event'].set()
-                        break
-            del self._buffer[:8 + data_length]
+            else:
+                self._cmd_done(pkt_id, pkt_type == b'CMP', bytes(data))
+
+        if self._start == self._end:
+            self._start = 0
+            self._end = 0
+
+    @property
+    def outstanding(self):
+        return sum(len(queue) for queue in self._cmd_pending.values())
+
+    def _cmd_done(self, pkt_id, status, data):
+        queue = self._cmd_pending.get(pkt_id)
+        if not queue:
+            print(f'{pkt_id} response without command', file=stderr)
+            return
+        seq, future = queue.popleft()
+        if not future.done():
+            future.set_result((status, data))
+
+        # The cart answers commands in the order they were sent, so a timed
+        # out command sent before this one will never get its response.
+        for queue in self._cmd_pending.values():
+            while queue and queue[0][0] < seq and queue[0][1].done():
+                queue.popleft()
 
     async def reset(self):
-        self._buffer.clear()
+        self._start = 0
+        self._end = 0
+        for queue in self._cmd_pending.values():
+            for _, future in queue:
+                if not future.done():
+                    future.set_result((None, bytearray()))
         self._cmd_pending.clear()
 
+        if self.muxed:
+            self.connected.set()
+            return True
+
         count = 0
         self.transport.serial.dtr = True
         while not self.transport.serial.dsr and count < 10:
@@ -83,13 +225,13 @@ class SummerCart64(asyncio.Protocol):
             geometry = int.from_bytes(data[8:12])
             self.recv_disk_req_pkt(command, address, geometry, data[12:])
         elif pkt_id == 'I':
-            text = data.decode()
+            text = bytes(data).decode()
             self.recv_printf_pkt(text)
         elif pkt_id == 'S':
             save_type = int.from_bytes(data[0:4])
             self.recv_save_wb_pkt(save_type, data[4:])
         elif pkt_id == 'F':
-            progress = int.from_bytss(data[0:4])
+            progress = int.from_bytes(data[0:4])
             self.recv_update_status_pkt(progress)
         else:
             print(f'PKT{pkt_id} unknown', file=stderr)
@@ -126,47 +268,150 @@ class SummerCart64(asyncio.Protocol):
     def recv_update_status_pkt(self, progress):
         pass
 
-    async def send_cmd(self, pkt_id, arg0=0, arg1=0, data=b''):
-        if pkt_id in 'MU':
+    """Several commands may be outstanding at once, a timeout returns a None
+    status for that command only"""
+    async def send_cmd(self, pkt_id, arg0=0, arg1=0, data=b'',
+                       timeout=CMD_TIMEOUT):
+        if pkt_id in DATA_COMMANDS:
             arg1 = len(data)
 
         cmd = 'CMD' + pkt_id
-        pkt = cmd.encode() + arg0.to_bytes(4) + arg1.to_bytes(4) + data
-        self.transport.write(pkt)
+        self.transport.write(cmd.encode() + arg0.to_bytes(4) + arg1.to_bytes(4))
+        if data:
+            self.transport.write(data)
 
         if pkt_id == 'U': # USB_WRITE has no response, fake one
             return True, bytearray()
 
-        event = asyncio.Event()
-        pending = {
-            'pkt_id': pkt_id,
-            'status': None,
-            'data': bytearray(),
-            'event': event,
-        }
-        self._cmd_pending.append(pending)
+        # A timed out future stays queued to absorb a late response, until
+        # a newer command with the same id is sent.  Past that point a lost
+        # response would shift every later one onto the wrong future.
+        queue = self._cmd_pending[pkt_id]
+        if any(future.done() for _, future in queue):
+            queue = deque(entry for entry in queue if not entry[1].done())
+            self._cmd_pending[pkt_id] = queue
+        future = asyncio.get_running_loop().create_future()
+        self._cmd_seq += 1
+        queue.append((self._cmd_seq, future))
+        start = perf_counter()
         try:
-            await asyncio.wait_for(event.wait(), 0.5)
+            status, data = await asyncio.wait_for(future, timeout)
         except TimeoutError:
-            await self.reset()
+            self.stats['command_timeouts'] += 1
+            return None, bytearray()
+
+        elapsed = perf_counter() - start
+        self.stats['commands'] += 1
+        self.stats['command_seconds'] += elapsed
+        if elapsed > self.stats['command_max_seconds']:
+            self.stats['command_max_seconds'] = elapsed
+        return status, data
+
+    def _update_writable(self):
+        depth = len(self._usb_queue)
+        self.stats['usb_queue_depth'] = depth
+        if depth > self.stats['usb_queue_max']:
+            self.stats['usb_queue_max'] = depth
+        # cleared at USB_QUEUE_SIZE, set again once down to the low water mark
+        if depth >= USB_QUEUE_SIZE or not self._writing.is_set():
+            self.usb_writable.clear()
+        elif depth <= USB_QUEUE_LOW_WATER:
+            self.usb_writable.set()
+
+    """Queues a USB packet for the writer task. With merge set, the data is
+    appended to a queued packet of the same type that is still waiting, up
+    to USB_MERGE_SIZE.  The queue is not bounded here, callers wait on
+    drain_usb()"""
+    def send_usb_cmd(self, pkt_type, data, merge=False):
+        queue = self._usb_queue
+        if merge and queue and queue[-1][0] == pkt_type:
+            pending = queue[-1]
+            if len(pending[1]) + len(data) <= USB_MERGE_SIZE:
+                if not isinstance(pending[1], bytearray):
+                    pending[1] = bytearray(pending[1])
+                pending[1] += data
+                self.stats['usb_merged'] += 1
+                return
 
-        return pending['status'], pending['data']
+        queue.append([pkt_type, data, perf_counter()])
+        self._update_writable()
+        self._usb_queued.set()
+        if self._usb_writer is None:
+            self._usb_writer = asyncio.create_task(self._write_usb())
 
-    def send_usb_cmd(self, pkt_type, data):
-        asyncio.create_task(self.send_cmd('U', pkt_type, 0, data))
+    """Waits until the queue is down to USB_QUEUE_LOW_WATER packets"""
+    async def drain_usb(self):
+        await self.usb_writable.wait()
 
+    async def _write_usb(self):
+        queue = self._usb_queue
+        while True:
+            await self._usb_queued.wait()
+            await self._writing.wait()
+            if not queue:
+                self._usb_queued.clear()
+                continue
+
+            # popped before writing, so nothing merges into a sent packet
+            pkt_type, data, queued = queue.popleft()
+            self._update_writable()
+            await self.send_cmd('U', pkt_type, 0, data)
+
+            elapsed = perf_counter() - queued
+            self.stats['usb_writes'] += 1
+            self.stats['usb_write_seconds'] += elapsed
+            if elapsed > self.stats['usb_write_max_seconds']:
+                self.stats['usb_write_max_seconds'] = elapsed
+
+    async def write_memory(self, address, data, block_size=MEMORY_BLOCK_SIZE,
+                           window=MEMORY_WINDOW):
+        data = memoryview(data)
+        start = perf_counter()
+        step = block_size * window
+        for offset in range(0, len(data), step):
+            results = await asyncio.gather(*(
+                self.send_cmd('M', address + i, 0, data[i:i + block_size])
+                for i in range(offset, min(offset + step, len(data)),
+                               block_size)))
+            if not all(status for status, _ in results):
+                return False
+        self.stats['memory_write_bytes'] += len(data)
+        self.stats['memory_write_seconds'] += perf_counter() - start
+        return True
+
+    async def read_memory(self, address, length, block_size=MEMORY_BLOCK_SIZE,
+                          window=MEMORY_WINDOW):
+        data = bytearray()
+        step = block_size * window
+        for offset in range(0, length, step):
+            results = await asyncio.gather(*(
+                self.send_cmd('m', address + i, min(block_size, length - i))
+                for i in range(offset, min(offset + step, length),
+                               block_size)))
+            for status, block in results:
+                if not status:
+                    return None
+                data += block
+        return data
+
+    """port is a serial device, or the socket of a cart multiplexer, given
+    as a path or as unix:path"""
     @classmethod
-    async def connect(cls, port):
+    async def connect(cls, port, subscribe=None):
         loop = asyncio.get_event_loop()
-        _, protocol = await create_serial_connection(loop, cls, port)
+        factory = lambda: cls(subscribe)
+        if is_socket(port):
+            path = port.removeprefix('unix:')
+            _, protocol = await loop.create_unix_connection(factory, path)
+        else:
+            _, protocol = await create_serial_connection(loop, factory, port)
         await asyncio.wait_for(protocol.connected.wait(), 1)
         return protocol
 
     async def get_version(self):
-        _, name = await self.send_cmd('v')
+        (_, name), (_, version) = await asyncio.gather(
+            self.send_cmd('v'), self.send_cmd('V'))
         name = name.decode()
-
-        _, version = await self.send_cmd('V')
         major = int.from_bytes(version[0:2])
         minor = int.from_bytes(version[2:4])
         revision = int.from_bytes(version[4:8])
@@ -1,51 +1,226 @@
 import asyncio
+from collections import deque
 from copy import deepcopy
 import json
+import random
+from time import perf_counter
 
 import json_delta
 
-from .. import USB_HEARTBEAT, Terminal64
+from .. import USB_HEARTBEAT, USB_MESSAGES, Terminal64
+from .clock import FrameClock
 from .display import disp_height, disp_width
-from .entity import (CircleEntity, Entity, RectangleEntity, SpriteEntity,
-                     TextEntity)
-from .sprite import Sprite
-from .util import collision, decode_input
+from .entity import (SKIP_ENTITY, CircleEntity, Entity, RectangleEntity,
+                     SpriteEntity, TextEntity)
+from .scheduler import PRIORITY_HIGHEST, Scheduler
+from .slots import Slots
+from .sprite import Sprite, Upload
+from .util import Inputs, collision, decode_input
+from ..util import vlq_pack
 
-__all__ = ['CircleEntity', 'Entity', 'Game', 'GameClient', 'RectangleEntity',
-           'Sprite', 'SpriteEntity', 'TextEntity', 'collision', 'disp_height',
-           'disp_width']
+__all__ = ['CircleEntity', 'Entity', 'FrameClock', 'Game', 'GameClient',
+           'Inputs', 'RectangleEntity', 'Sprite', 'SpriteEntity', 'TextEntity',
+           'collision', 'disp_height', 'disp_width']
 
 GAME_IN_INPUT       = 0
+GAME_IN_RESIDENT    = 1
+GAME_IN_EVICT       = 2
+GAME_IN_VBLANK      = 3
+GAME_IN_STATE       = 4
+GAME_IN_SDRAM       = 5
 
 GAME_OUT_RESET      = 0
 GAME_OUT_READY      = 1
 GAME_OUT_BGCOLOR    = 2
 GAME_OUT_SPRITE     = 3
 GAME_OUT_ENTITY     = 4
+GAME_OUT_BLOB       = 5
+GAME_OUT_BIND       = 6
+GAME_OUT_SDRAM      = 7
+GAME_OUT_VBLANK     = 8
+GAME_OUT_FRAME      = 9
+GAME_OUT_RESUME     = 10
+
+# Ends below the top 8 MiB of SDRAM, which UNFLoader uses for USB transfers
+SDRAM_STAGING       = 0x03000000
+SDRAM_STAGING_SIZE  = 0x00800000
 
 class Game:
-    def __init__(self, cart):
+    bulk_threshold = 8192
+    history_size = 256 * 1024
+    resume_timeout = 0.5
+
+    def __init__(self, cart, budget=4096, clock=None):
         self.cart = cart
+        self.clock = FrameClock() if clock is None else clock
+        self.console_frame = None
+        self.inputs = Inputs()
         self.t64 = Terminal64(cart)
         self.t64.usb_pkt_handlers[USB_HEARTBEAT] = self.handle_usb_heartbeat
         self.t64.handle_usb_message = self.handle_usb_message
+        self.t64.usb_message_handlers.update({
+            GAME_IN_INPUT: self.handle_input_message,
+            GAME_IN_RESIDENT: self.handle_resident,
+            GAME_IN_EVICT: self.handle_evict,
+            GAME_IN_VBLANK: self.handle_vblank,
+            GAME_IN_STATE: self.handle_state,
+            GAME_IN_SDRAM: self.handle_sdram,
+        })
+        self.scheduler = Scheduler(budget)
+        self.stats = {
+            'dirty': 0,
+            'suppressed_messages': 0,
+            'suppressed_bytes': 0,
+            'bytes_sent': 0,
+            'bytes_deferred': 0,
+            'deferred': 0,
+            'chunked_upload_bytes': 0,
+            'chunked_upload_seconds': 0.0,
+            'bulk_upload_bytes': 0,
+            'bulk_upload_seconds': 0.0,
+            'resumes': 0,
+            'resumed_frames': 0,
+            'resumed_bytes': 0,
+            'full_resets': 0,
+            'frames': 0,
+            'frame_seconds': 0.0,
+            'frame_max_seconds': 0.0,
+        }
+        self._entity_buffer = bytearray()
+        self._staging = 0
+        self._staging_ranges = {}
+        self._uploads = {}
+        self._resume = None
         self.reset()
 
+    # The console answers GAME_OUT_RESUME with its session and the sequence
+    # number of the last frame it applied.  Frames after it are replayed
+    # from history; anything else falls back to a full reset.
     def handle_usb_heartbeat(self, data):
+        if self._resume is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._resume = loop.call_later(self.resume_timeout, self._resume_failed)
+        # sent on its own, messages already queued belong to the next frame
+        self.cart.send_usb_cmd(USB_MESSAGES, bytes(vlq_pack(GAME_OUT_RESUME) +
+                                                   vlq_pack(0)), merge=True)
+
+    def handle_state(self, data):
+        if self._resume is None:
+            return
+        self._resume.cancel()
+        self._resume = None
+        session = int.from_bytes(data[0:4])
+        sequence = int.from_bytes(data[4:8])
+        if session != self.session or sequence > self.sequence:
+            self._resume_failed()
+            return
+
+        missed = [frame for frame in self._history if frame[0] > sequence]
+        if len(missed) < self.sequence - sequence:
+            self._resume_failed()
+            return
+        for _, data in missed:
+            self.cart.send_usb_cmd(USB_MESSAGES, data, merge=True)
+            self.stats['resumed_bytes'] += len(data)
+        self.stats['resumed_frames'] += len(missed)
+        self.stats['resumes'] += 1
+
+    def _resume_failed(self):
+        self._resume = None
+        self.stats['full_resets'] += 1
         asyncio.create_task(self.areset())
 
     def handle_usb_message(self, message_type, data):
-        if message_type == GAME_IN_INPUT:
-            input = decode_input(data)
-            self.handle_input(input)
-        else:
-            print('unhandled message:', message_type, data)
+        print('unhandled message:', message_type, bytes(data))
+
+    def handle_input_message(self, data):
+        self.inputs = decode_input(data, self.inputs)
+        self.handle_input(self.inputs)
+
+    def handle_resident(self, data):
+        self.resident = {bytes(data[i:i + 8]) for i in range(0, len(data), 8)}
+
+    def handle_vblank(self, data):
+        self.console_frame = int.from_bytes(data)
+        self.clock.sync()
+
+    def handle_sdram(self, data):
+        self._staging_ranges.pop(bytes(data), None)
+
+    def handle_evict(self, data):
+        hash = bytes(data)
+        if self.resident is not None:
+            self.resident.discard(hash)
+        self._uploads.pop(hash, None)
+        self._staging_ranges.pop(hash, None)
+        for sprite in self._sprites:
+            if sprite.size and sprite.hash == hash:
+                sprite._dirty = True
+
+    @property
+    def sprites(self):
+        return self._sprites
+    @sprites.setter
+    def sprites(self, value):
+        self._sprites.assign(value)
+
+    @property
+    def entities(self):
+        return self._entities
+    @entities.setter
+    def entities(self, value):
+        self._entities.assign(value)
+
+    """Entity rows of an EntityTable, its index range is reserved from the
+    entity slots when it is attached"""
+    @property
+    def table(self):
+        return self._table
+    @table.setter
+    def table(self, value):
+        if self._table is not None:
+            self._entities.release(self._table.offset, self._table.capacity)
+        if value is not None:
+            value.offset = self._entities.reserve(value.capacity)
+        self._table = value
+
+    def add_sprite(self, sprite):
+        return self._sprites.add(sprite)
+
+    def remove_sprite(self, sprite):
+        return self._sprites.remove(sprite)
+
+    def add_entity(self, entity):
+        return self._entities.add(entity)
+
+    def remove_entity(self, entity):
+        return self._entities.remove(entity)
 
     def reset(self):
+        if self._resume is not None:
+            self._resume.cancel()
+            self._resume = None
         self.frame = 0
-        self.sprites = []
-        self.entities = []
-        self.t64.queue_usb_message(GAME_OUT_RESET)
+        self._sprites = Slots()
+        self._entities = Slots()
+        self._entities_sent = {}
+        self.resident = None
+        # staged data whose GAME_OUT_SDRAM never went out is not read
+        for hash, upload in self._uploads.items():
+            if upload.address is not None:
+                self._staging_ranges.pop(hash, None)
+        self._uploads = {}
+        self._table = None
+        self.scheduler.clear()
+        self.clock.reset()
+        self.session = random.randrange(1, 1 << 32)
+        self.sequence = 0
+        self._history = deque()
+        self._history_bytes = 0
+        self.t64.queue_usb_message(GAME_OUT_RESET, self.session.to_bytes(4))
+        self.t64.queue_usb_message(GAME_OUT_VBLANK,
+                                   bytes((self.clock.locked,)))
 
     async def areset(self):
         await self.cart.reset()
@@ -56,28 +231,199 @@ class Game:
     def ready(self):
         self.t64.queue_usb_message(GAME_OUT_READY)
 
+    def _queue_sprites(self):
+        waiting = []
+        for i, sprite in self._sprites.pop_dirty():
+            if sprite is None or not sprite.size:
+                if sprite is not None:
+                    sprite._dirty = False
+                self.scheduler.queue(GAME_OUT_SPRITE, i.to_bytes(2),
+                                     PRIORITY_HIGHEST, ('sprite', i))
+                continue
+            hash = sprite.hash
+            if self.resident is not None and hash in self.resident:
+                self.scheduler.queue(GAME_OUT_BIND, sprite.bind_message(i),
+                                     sprite.priority, ('sprite', i))
+                continue
+            if self.resident is not None and hash not in self._uploads:
+                self._start_upload(sprite)
+            waiting.append(i)
+
+        for hash, upload in self._uploads.items():
+            sprite = upload.sprite
+            if upload.address is not None:
+                data = sprite.sdram_message(upload.address)
+                self.scheduler.queue(GAME_OUT_SDRAM, data, sprite.priority,
+                                     ('blob', hash, None))
+            for offset in upload.offsets:
+                data = sprite.chunk_message(offset)
+                self.scheduler.queue(GAME_OUT_BLOB, data, sprite.priority,
+                                     ('blob', hash, offset))
+        return waiting
+
+    def _start_upload(self, sprite):
+        bulk = (self.bulk_threshold is not None and
+                sprite.size >= self.bulk_threshold and
+                hasattr(self.cart, 'write_memory'))
+        upload = Upload(sprite, bulk)
+        self._uploads[sprite.hash] = upload
+        if bulk:
+            asyncio.create_task(self._bulk_upload(upload))
+
+    """Allocates staging space for an upload until the console reports it
+    copied (GAME_IN_SDRAM) or evicted the blob, returns None when the next
+    free range is still in use"""
+    def _staging_alloc(self, hash, size):
+        size = (size + 7) & ~7
+        if size > SDRAM_STAGING_SIZE or hash in self._staging_ranges:
+            return None
+        start = self._staging
+        if start + size > SDRAM_STAGING_SIZE:
+            start = 0
+        end = start + size
+        for used_start, used_end in self._staging_ranges.values():
+            if start < used_end and used_start < end:
+                return None
+        self._staging = end
+        self._staging_ranges[hash] = start, end
+        return SDRAM_STAGING + start
+
+    async def _bulk_upload(self, upload):
+        hash = upload.sprite.hash
+        address = self._staging_alloc(hash, upload.sprite.size)
+        if address is None:
+            upload.fallback()
+        elif not await self.cart.write_memory(address, upload.sprite._data):
+            self._staging_ranges.pop(hash, None)
+            upload.fallback()
+        elif self._uploads.get(hash) is not upload:
+            # dropped by a reset while writing, the console never reads it
+            self._staging_ranges.pop(hash, None)
+        else:
+            upload.address = address
+
+    def _upload_sent(self, hash, offset):
+        upload = self._uploads[hash]
+        if not upload.sent(offset):
+            return
+        del self._uploads[hash]
+        self.resident.add(hash)
+        kind = 'bulk' if upload.bulk else 'chunked'
+        self.stats[f'{kind}_upload_bytes'] += upload.sprite.size
+        self.stats[f'{kind}_upload_seconds'] += upload.elapsed
+
+    """Encodes dirty entities back to back into one reused buffer, payloads
+    are views into it that stay valid until the next call"""
+    def _queue_entities(self):
+        dirty = self._entities.pop_dirty()
+        size = sum(Entity.encoder.size if entity is None else
+                   entity.message_size for _, entity in dirty)
+        if len(self._entity_buffer) < size:
+            # replaced rather than resized, last frame's views may be alive
+            self._entity_buffer = bytearray(max(size,
+                                                2 * len(self._entity_buffer)))
+        buffer = self._entity_buffer
+        view = memoryview(buffer)
+        offset = 0
+        payloads = {}
+        suppressed_messages = 0
+        suppressed_bytes = 0
+        for i, entity in dirty:
+            if entity is None:
+                end = Entity.encoder.pack_into(buffer, offset, i, SKIP_ENTITY)
+                priority = PRIORITY_HIGHEST
+            else:
+                end = entity.message_into(buffer, offset, i)
+                priority = entity.priority
+            data = view[offset:end]
+            offset = end
+            if self._entities_sent.get(i) == data:
+                suppressed_messages += 1
+                suppressed_bytes += len(data)
+                continue
+            payloads[i] = data
+            self.scheduler.queue(GAME_OUT_ENTITY, data, priority, ('entity', i))
+        self.stats['suppressed_messages'] = suppressed_messages
+        self.stats['suppressed_bytes'] = suppressed_bytes
+        return payloads
+
     def flush(self):
-        for i, sprite in enumerate(self.sprites):
-            if sprite.dirty:
-                self.t64.queue_usb_message(GAME_OUT_SPRITE, sprite.message(i))
-        for i, entity in enumerate(self.entities):
-            if entity.dirty:
-                self.t64.queue_usb_message(GAME_OUT_ENTITY, entity.message(i))
-        self.t64.send_usb_messages()
+        dirty = len(self._sprites.dirty) + len(self._entities.dirty)
+        waiting = self._queue_sprites()
+        payloads = self._queue_entities()
+
+        sent, deferred = self.scheduler.drain(self.t64)
+        for kind, *key in sent:
+            if kind == 'entity':
+                self._entities_sent[key[0]] = bytes(payloads[key[0]])
+            elif kind == 'blob':
+                self._upload_sent(*key)
+        for kind, *key in deferred:
+            if kind == 'entity':
+                self._entities.mark(key[0])
+            elif kind == 'sprite':
+                self._sprites.mark(key[0])
+        for i in waiting:
+            self._sprites.mark(i)
+        self.stats.update(self.scheduler.stats)
+
+        if self.table is not None:
+            dirty += int(self.table.dirty.sum())
+            budget = self.scheduler.budget
+            if budget is not None:
+                budget = max(0, budget - self.t64.queued)
+            data = self.table.encode(GAME_OUT_ENTITY, budget)
+            self.t64.queue_usb_raw(data)
+            self.stats['bytes_sent'] += len(data)
+            self.stats['bytes_deferred'] += self.table.bytes_deferred
+            self.stats['deferred'] += self.table.deferred
+
+        self.stats['dirty'] = dirty
+        if self._resume is not None:
+            # hold frames back until the console says what it missed
+            return
+        if not self.t64.queued:
+            self.t64.send_usb_messages()
+            return
+
+        self.sequence += 1
+        self.t64.queue_usb_message(GAME_OUT_FRAME, self.sequence.to_bytes(4))
+        data = self.t64.send_usb_messages()
+        self._history.append((self.sequence, data))
+        self._history_bytes += len(data)
+        while self._history_bytes > self.history_size and len(self._history) > 1:
+            _, data = self._history.popleft()
+            self._history_bytes -= len(data)
+
+    def start(self):
+        self.reset()
+        self.setup()
+        self.flush()
+
+    def step(self):
+        start = perf_counter()
+        self.loop()
+        self.flush()
+        self.frame += 1
+        elapsed = perf_counter() - start
+        self.stats['frames'] += 1
+        self.stats['frame_seconds'] += elapsed
+        if elapsed > self.stats['frame_max_seconds']:
+            self.stats['frame_max_seconds'] = elapsed
+
+    def stop(self):
+        self.reset()
+        self.flush()
 
     async def run(self):
         try:
-            self.reset()
-            self.setup()
-            self.flush()
+            self.start()
             while True:
-                await asyncio.sleep(1/60)
-                self.loop()
-                self.flush()
-                self.frame += 1
+                await self.clock.tick()
+                await self.t64.drain()
+                self.step()
         except asyncio.CancelledError:
-            self.reset()
-            self.flush()
+            self.stop()
 
     """User function expected to be overridden"""
     def setup(self):
@@ -87,10 +433,10 @@ class Game:
     def loop(self):
         pass
 
-    """User function expected to be inherited"""
-    def handle_input(self, input):
-        if not hasattr(self, 'last_inputs'):
-            self.last_inputs = decode_input(b'\0\0\0\0\0\0\0\0')
+    """User function expected to be inherited, inputs.pressed() and
+    inputs.released() compare against the previous sample"""
+    def handle_input(self, inputs):
+        pass
 
 class GameClient(asyncio.Protocol):
     def __init__(self):
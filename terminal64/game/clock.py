@@ -0,0 +1,96 @@
+import asyncio
+
+from ..util import wake_future
+
+CLOCK_SKIP      = 'skip'
+CLOCK_CATCH_UP  = 'catch-up'
+
+# Ticks are scheduled against absolute deadlines, so compute time and wakeup
+# latency do not add up over frames.  When a tick is late by more than a
+# period, 'skip' drops the missed ticks and 'catch-up' runs them back to back,
+# at most max_catch_up at a time.
+#
+# A locked clock is re-phased by sync(), called when the console signals a
+# new frame, so ticks land lead seconds before the console's next frame.  A
+# tick already waiting moves to the new deadline.
+class FrameClock:
+    def __init__(self, rate=60, policy=CLOCK_SKIP, locked=False, lead=0.004,
+                 max_catch_up=4):
+        if policy not in (CLOCK_SKIP, CLOCK_CATCH_UP):
+            raise ValueError(f'unknown clock policy {policy!r}')
+        self.period = 1 / rate
+        self.policy = policy
+        self.locked = locked
+        self.lead = lead
+        self.max_catch_up = max_catch_up
+        self.deadline = None
+        self.stats = {
+            'ticks': 0,
+            'late': 0,
+            'skipped': 0,
+            'syncs': 0,
+            'jitter_seconds': 0.0,
+            'jitter_max_seconds': 0.0,
+        }
+        self._behind = 0
+        self._waiter = None
+
+    @property
+    def jitter(self):
+        if not self.stats['ticks']:
+            return 0.0
+        return self.stats['jitter_seconds'] / self.stats['ticks']
+
+    def reset(self):
+        self.deadline = None
+        self._behind = 0
+
+    def sync(self, now=None):
+        if not self.locked:
+            return
+        if now is None:
+            now = asyncio.get_running_loop().time()
+        # tick() advances by one period before waiting
+        self.deadline = now - self.lead
+        self._behind = 0
+        self.stats['syncs'] += 1
+        if self._waiter is not None:
+            # a waiting tick() already advanced, wake it to re-arm
+            self.deadline += self.period
+            wake_future(self._waiter)
+
+    async def tick(self):
+        loop = asyncio.get_running_loop()
+        if self.deadline is None:
+            self.deadline = loop.time()
+        else:
+            self.deadline += self.period
+
+        now = loop.time()
+        if now - self.deadline >= self.period:
+            self.stats['late'] += 1
+            missed = int((now - self.deadline) / self.period)
+            if self.policy == CLOCK_SKIP or self._behind >= self.max_catch_up:
+                self.deadline += missed * self.period
+                self.stats['skipped'] += missed
+                self._behind = 0
+            else:
+                self._behind += 1
+        else:
+            self._behind = 0
+
+        while now < self.deadline:
+            self._waiter = loop.create_future()
+            handle = loop.call_at(self.deadline, wake_future, self._waiter)
+            try:
+                await self._waiter
+            finally:
+                handle.cancel()
+                self._waiter = None
+            now = loop.time()
+
+        jitter = now - self.deadline
+        self.stats['ticks'] += 1
+        self.stats['jitter_seconds'] += jitter
+        if jitter > self.stats['jitter_max_seconds']:
+            self.stats['jitter_max_seconds'] = jitter
@@ -0,0 +1,73 @@
+from struct import Struct
+
+FIELD_BITS = {
+    'u8':   8,
+    'u12':  12,
+    'u16':  16,
+    'f16':  16,
+}
+
+# Big-endian layout matching the packed structs in src/game.h.  Runs of 12-bit
+# fields are merged into byte-aligned integers, everything else maps directly
+# onto a struct format character.
+class Encoder:
+    def __init__(self, *fields):
+        self.fields = fields
+        self._groups = []
+        fmt = '>'
+        i = 0
+        while i < len(fields):
+            field = fields[i]
+            if field == 'u8':
+                fmt += 'B'
+                self._groups.append(None)
+                i += 1
+            elif field == 'u16':
+                fmt += 'H'
+                self._groups.append(None)
+                i += 1
+            elif field == 'f16':
+                fmt += 'e'
+                self._groups.append(None)
+                i += 1
+            elif field == 'u12':
+                j = i
+                bits = 0
+                while j < len(fields) and (fields[j] == 'u12' or bits % 8):
+                    bits += FIELD_BITS[fields[j]]
+                    j += 1
+                if bits % 8:
+                    raise ValueError('bit fields must end on a byte boundary')
+                widths = tuple(FIELD_BITS[f] for f in fields[i:j])
+                fmt += f'{bits // 8}s'
+                self._groups.append(widths)
+                i = j
+            else:
+                raise ValueError(f'unknown field type `{field}`')
+        self._struct = Struct(fmt)
+        self.size = self._struct.size
+
+    def _values(self, values):
+        if not any(self._groups):
+            return values
+        out = []
+        it = iter(values)
+        for widths in self._groups:
+            if widths is None:
+                out.append(next(it))
+                continue
+            packed = 0
+            for width in widths:
+                value = int(next(it))
+                if not 0 <= value < 1 << width:
+                    raise ValueError(f'{value} does not fit in u{width}')
+                packed = (packed << width) | value
+            out.append(packed.to_bytes(sum(widths) // 8))
+        return out
+
+    def pack(self, *values):
+        return self._struct.pack(*self._values(values))
+
+    def pack_into(self, buffer, offset, *values):
+        self._struct.pack_into(buffer, offset, *self._values(values))
+        return offset + self.size
@@ -1,6 +1,6 @@
-from bitstring import Bits, BitStream
-
 from .display import disp_height, disp_width
+from .encoder import Encoder
+from .slots import Slotted
 from ..util import clamp
 
 SKIP_ENTITY         = 0
@@ -10,7 +10,7 @@ CIRCLE_ENTITY       = 3
 TEXT_ENTITY         = 4
 
 
-class BBox:
+class BBox(Slotted):
     def __init__(self):
         self._x = 0
         self._y = 0
@@ -67,6 +67,9 @@ class BBox:
         return self.y + self.height
 
 class Entity(BBox):
+    encoder = Encoder('u16', 'u8')
+    priority = 0
+
     def __init__(self):
         super().__init__()
         self._type = SKIP_ENTITY
@@ -115,16 +118,27 @@ class Entity(BBox):
             self._dirty = True
 
     @property
-    def bitstream(self):
-        bs = BitStream()
-        bs.append(Bits(uint=self._type, length=8))
-        return bs
+    def fields(self):
+        return (self._type,)
+
+    @property
+    def message_size(self):
+        return self.encoder.size + len(self._data)
 
     def message(self, i):
         self._dirty = False
-        return i.to_bytes(2) + self.bitstream.bytes + self._data
+        return self.encoder.pack(i, *self.fields) + self._data
+
+    def message_into(self, buffer, offset, i):
+        self._dirty = False
+        offset = self.encoder.pack_into(buffer, offset, i, *self.fields)
+        buffer[offset:offset + len(self._data)] = self._data
+        return offset + len(self._data)
 
 class SpriteEntity(Entity):
+    encoder = Encoder('u16', 'u8', 'u8', 'u8', 'f16', 'f16', 'u8', 'u8', 'u8',
+                      'f16', 'f16', 'f16')
+
     def __init__(self):
         super().__init__()
         self._type = SPRITE_ENTITY
@@ -227,20 +241,10 @@ class SpriteEntity(Entity):
             self._dirty = True
 
     @property
-    def bitstream(self):
-        bs = BitStream()
-        bs.append(Bits(uint=self._type, length=8))
-        bs.append(Bits(uint=self._index, length=8))
-        bs.append(Bits(uint=self._tile, length=8))
-        bs.append(Bits(float16=self.x))
-        bs.append(Bits(float16=self.y))
-        bs.append(Bits(uint=self.flags, length=8))
-        bs.append(Bits(uint=int(self.cx), length=8))
-        bs.append(Bits(uint=int(self.cy), length=8))
-        bs.append(Bits(float16=self.scale_x))
-        bs.append(Bits(float16=self.scale_y))
-        bs.append(Bits(float16=self.theta))
-        return bs
+    def fields(self):
+        return (self._type, self._index, self._tile, self.x, self.y,
+                self.flags, int(self.cx), int(self.cy), self.scale_x,
+                self.scale_y, self.theta)
 
 class SolidEntity(Entity):
     def __init__(self):
@@ -270,22 +274,19 @@ class SolidEntity(Entity):
             self._dirty = True
 
 class RectangleEntity(SolidEntity):
+    encoder = Encoder('u16', 'u8', 'u12', 'u12', 'u12', 'u12', 'u16')
+
     def __init__(self):
         super().__init__()
         self._type = RECTANGLE_ENTITY
 
     @property
-    def bitstream(self):
-        bs = BitStream()
-        bs.append(Bits(uint=self._type, length=8))
-        bs.append(Bits(uint=int(self.x0), length=12))
-        bs.append(Bits(uint=int(self.y0), length=12))
-        bs.append(Bits(uint=int(self.x1), length=12))
-        bs.append(Bits(uint=int(self.y1), length=12))
-        bs.append(Bits(uint=self._color, length=16))
-        return bs
+    def fields(self):
+        return (self._type, self.x0, self.y0, self.x1, self.y1, self._color)
 
 class CircleEntity(SolidEntity):
+    encoder = Encoder('u16', 'u8', 'u12', 'u12', 'u8', 'u16')
+
     def __init__(self):
         super().__init__()
         self._type = CIRCLE_ENTITY
@@ -307,16 +308,12 @@ class CircleEntity(SolidEntity):
         return self._radius * 2
 
     @property
-    def bitstream(self):
-        bs = BitStream()
-        bs.append(Bits(uint=self._type, length=8))
-        bs.append(Bits(uint=int(self.x), length=12))
-        bs.append(Bits(uint=int(self.y), length=12))
-        bs.append(Bits(uint=int(self.radius), length=8))
-        bs.append(Bits(uint=self._color, length=16))
-        return bs
+    def fields(self):
+        return (self._type, self.x, self.y, int(self.radius), self._color)
 
 class TextEntity(SolidEntity):
+    encoder = Encoder('u16', 'u8', 'f16', 'f16', 'u12', 'u12', 'u8', 'u16')
+
     def __init__(self, string=None):
         super().__init__()
         self._type = TEXT_ENTITY
@@ -339,13 +336,6 @@ class TextEntity(SolidEntity):
             self._dirty = True
 
     @property
-    def bitstream(self):
-        bs = BitStream()
-        bs.append(Bits(uint=self._type, length=8))
-        bs.append(Bits(float16=self.x))
-        bs.append(Bits(float16=self.y))
-        bs.append(Bits(uint=int(self.width), length=12))
-        bs.append(Bits(uint=int(self.height), length=12))
-        bs.append(Bits(uint=self.flags, length=8))
-        bs.append(Bits(uint=self._color, length=16))
-        return bs
+    def fields(self):
+        return (self._type, self.x, self.y, self.width, self.height,
+                self.flags, self._color)
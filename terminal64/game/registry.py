@@ -0,0 +1,73 @@
+import mmap
+import os
+from collections import OrderedDict
+from hashlib import blake2b
+
+def content_hash(data):
+    return blake2b(data, digest_size=8).digest()
+
+class Asset:
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._hash = None
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = content_hash(self.data)
+        return self._hash
+
+    @property
+    def size(self):
+        return len(self.data)
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+# Eviction only drops the registry's reference, a mapping stays alive for as
+# long as a sprite still holds a view into it.
+class AssetRegistry:
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self._assets = OrderedDict()
+        self.size = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def get(self, path):
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        key = path, st.st_mtime_ns, st.st_size
+        asset = self._assets.get(key)
+        if asset is not None:
+            self._assets.move_to_end(key)
+            self.stats['hits'] += 1
+            return asset
+
+        self.stats['misses'] += 1
+        asset = Asset(path, _map(path))
+        self._assets[key] = asset
+        self.size += asset.size
+        self.evict()
+        return asset
+
+    def evict(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        while self.size > max_bytes and len(self._assets) > 1:
+            _, asset = self._assets.popitem(last=False)
+            self.size -= asset.size
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        self._assets.clear()
+        self.size = 0
+
+registry = AssetRegistry()
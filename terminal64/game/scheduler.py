@@ -0,0 +1,52 @@
+from ..util import vlq_size
+
+PRIORITY_HIGHEST = 1 << 16
+
+class Scheduler:
+    def __init__(self, budget=4096):
+        self.budget = budget
+        self._pending = []
+        self._age = {}
+        self.stats = {
+            'bytes_sent': 0,
+            'bytes_deferred': 0,
+            'deferred': 0,
+        }
+
+    def queue(self, message_type, data, priority=0, key=None):
+        priority += self._age.get(key, 0)
+        self._pending.append((priority, message_type, data, key))
+
+    """Queues what fits in the frame budget, returns keys of sent and deferred
+    messages"""
+    def drain(self, t64):
+        pending = sorted(self._pending, key=lambda message: -message[0])
+        self._pending = []
+
+        sent = []
+        deferred = []
+        used = t64.queued
+        bytes_sent = 0
+        bytes_deferred = 0
+        for _, message_type, data, key in pending:
+            size = vlq_size(message_type) + vlq_size(len(data)) + len(data)
+            if (self.budget is not None and used + size > self.budget and
+                    sent):
+                deferred.append(key)
+                bytes_deferred += size
+                self._age[key] = self._age.get(key, 0) + 1
+                continue
+            t64.queue_usb_message(message_type, data)
+            sent.append(key)
+            used += size
+            bytes_sent += size
+            self._age.pop(key, None)
+
+        self.stats['bytes_sent'] = bytes_sent
+        self.stats['bytes_deferred'] = bytes_deferred
+        self.stats['deferred'] = len(deferred)
+        return sent, deferred
+
+    def clear(self):
+        self._pending = []
+        self._age = {}
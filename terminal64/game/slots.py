@@ -0,0 +1,107 @@
+class Slotted:
+    _owner = None
+    _slot = None
+    __dirty = True
+
+    @property
+    def _dirty(self):
+        return self.__dirty
+    @_dirty.setter
+    def _dirty(self, value):
+        self.__dirty = value
+        if value and self._owner is not None:
+            self._owner.add(self._slot)
+
+    @property
+    def slot(self):
+        return self._slot
+
+# Marks slots handed out as a block by reserve()
+_RESERVED = object()
+
+class Slots:
+    def __init__(self, items=()):
+        self._items = []
+        self._free = []
+        self._reserved = 0
+        self.dirty = set()
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items) - len(self._free) - self._reserved
+
+    def __iter__(self):
+        return (item for item in self._items
+                if item is not None and item is not _RESERVED)
+
+    def __contains__(self, item):
+        return item._owner is self.dirty
+
+    def __getitem__(self, slot):
+        return self._items[slot]
+
+    def add(self, item):
+        if item._owner is self.dirty:
+            return item._slot
+        if self._free:
+            slot = self._free.pop()
+            self._items[slot] = item
+        else:
+            slot = len(self._items)
+            self._items.append(item)
+        item._owner = self.dirty
+        item._slot = slot
+        item._dirty = True
+        return slot
+
+    def remove(self, item):
+        if item._owner is not self.dirty:
+            raise ValueError('item not in slots')
+        slot = item._slot
+        self._items[slot] = None
+        self._free.append(slot)
+        item._owner = None
+        item._slot = None
+        self.dirty.add(slot)
+        return slot
+
+    """Sets aside count consecutive slots past the ones in use and returns
+    the first, add() does not hand them out until they are released"""
+    def reserve(self, count):
+        start = len(self._items)
+        self._items.extend([_RESERVED] * count)
+        self._reserved += count
+        return start
+
+    def release(self, start, count):
+        for slot in range(start, start + count):
+            self._items[slot] = None
+            self._free.append(slot)
+            self.dirty.add(slot)
+        self._reserved -= count
+
+    def assign(self, items):
+        items = list(items)
+        keep = {id(item) for item in items}
+        for item in list(self):
+            if id(item) not in keep:
+                self.remove(item)
+        for item in items:
+            self.add(item)
+
+    def mark(self, slot):
+        item = self._items[slot]
+        if item is _RESERVED:
+            return
+        if item is None:
+            self.dirty.add(slot)
+        else:
+            item._dirty = True
+
+    """Returns (slot, item) pairs to send, item is None for freed slots"""
+    def pop_dirty(self):
+        slots = sorted(self.dirty)
+        self.dirty.clear()
+        return [(i, self._items[i]) for i in slots
+                if self._items[i] is None or self._items[i].dirty]
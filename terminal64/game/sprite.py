@@ -1,4 +1,18 @@
-class Sprite:
+from struct import Struct
+from time import perf_counter
+
+from .registry import content_hash, registry
+from .slots import Slotted
+
+SPRITE_CHUNK_SIZE = 2048
+
+blob_header = Struct('>8sII')
+bind_header = Struct('>H8s')
+sdram_header = Struct('>8sII')
+
+class Sprite(Slotted):
+    priority = 0
+
     def __init__(self, path=None):
         self.clear()
         if path:
@@ -8,15 +22,65 @@ class Sprite:
     def dirty(self):
         return self._dirty
 
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = content_hash(self._data)
+        return self._hash
+
+    @property
+    def size(self):
+        return len(self._data)
+
     def clear(self):
         self._data = b''
+        self._hash = None
         self._dirty = True
 
     def load(self, path):
-        with open(path, 'rb') as f:
-            self._data = f.read()
+        asset = registry.get(path)
+        self._data = asset.data
+        self._hash = asset.hash
         self._dirty = True
 
     def message(self, i):
         self._dirty = False
         return i.to_bytes(2) + self._data
+
+    def chunk_offsets(self, chunk_size=SPRITE_CHUNK_SIZE):
+        return list(range(0, len(self._data), chunk_size))
+
+    def chunk_message(self, offset, chunk_size=SPRITE_CHUNK_SIZE):
+        header = blob_header.pack(self.hash, len(self._data), offset)
+        return header + self._data[offset:offset + chunk_size]
+
+    def bind_message(self, i):
+        self._dirty = False
+        return bind_header.pack(i, self.hash)
+
+    def sdram_message(self, address):
+        return sdram_header.pack(self.hash, len(self._data), address)
+
+class Upload:
+    def __init__(self, sprite, bulk=False):
+        self.sprite = sprite
+        self.bulk = bulk
+        self.offsets = [] if bulk else sprite.chunk_offsets()
+        self.address = None
+        self.started = perf_counter()
+
+    @property
+    def elapsed(self):
+        return perf_counter() - self.started
+
+    """Records a sent message, returns True once the upload is complete"""
+    def sent(self, offset):
+        if offset is None:
+            self.address = None
+            return True
+        self.offsets.remove(offset)
+        return not self.offsets
+
+    def fallback(self):
+        self.bulk = False
+        self.offsets = self.sprite.chunk_offsets()
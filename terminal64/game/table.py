@@ -0,0 +1,199 @@
+import numpy as np
+
+from .display import disp_height, disp_width
+from .entity import (CIRCLE_ENTITY, RECTANGLE_ENTITY, SKIP_ENTITY,
+                     SPRITE_ENTITY, TextEntity)
+from ..util import vlq_pack
+
+COLUMNS = {
+    'type':     np.uint8,
+    'index':    np.uint8,
+    'tile':     np.uint8,
+    'x':        np.float64,
+    'y':        np.float64,
+    'width':    np.float64,
+    'height':   np.float64,
+    'flags':    np.uint8,
+    'cx':       np.float64,
+    'cy':       np.float64,
+    'scale_x':  np.float64,
+    'scale_y':  np.float64,
+    'theta':    np.float64,
+    'color':    np.uint16,
+    'radius':   np.float64,
+}
+
+# Record layouts mirror the Encoder declarations in entity.py; 12-bit runs
+# are stored as raw bytes and filled from a shifted integer column.
+LAYOUTS = {
+    SKIP_ENTITY: [
+        ('i', '>u2'), ('type', 'u1'),
+    ],
+    SPRITE_ENTITY: [
+        ('i', '>u2'), ('type', 'u1'), ('index', 'u1'), ('tile', 'u1'),
+        ('x', '>f2'), ('y', '>f2'), ('flags', 'u1'), ('cx', 'u1'),
+        ('cy', 'u1'), ('scale_x', '>f2'), ('scale_y', '>f2'),
+        ('theta', '>f2'),
+    ],
+    RECTANGLE_ENTITY: [
+        ('i', '>u2'), ('type', 'u1'), ('xy', 'u1', (6,)), ('color', '>u2'),
+    ],
+    CIRCLE_ENTITY: [
+        ('i', '>u2'), ('type', 'u1'), ('xy', 'u1', (3,)), ('radius', 'u1'),
+        ('color', '>u2'),
+    ],
+}
+
+def _pack12(*columns):
+    packed = np.zeros(len(columns[0]), np.uint64)
+    for column in columns:
+        packed <<= np.uint64(12)
+        packed |= column.astype(np.uint64) & np.uint64(0xfff)
+    nbytes = len(columns) * 12 // 8
+    return packed.astype('>u8').view(np.uint8).reshape(-1, 8)[:, 8 - nbytes:]
+
+
+class EntityTable:
+    def __init__(self, capacity, offset=0):
+        self.capacity = capacity
+        self.offset = offset
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype))
+        self.width[:] = 1
+        self.height[:] = 1
+        self.color[:] = 0xffff
+        self.radius[:] = 0.5
+        self.dirty = np.zeros(capacity, bool)
+        self.deferred = 0
+        self.bytes_deferred = 0
+        self._headers = {}
+
+    def view(self, row, cls, *args, **kwargs):
+        if issubclass(cls, TextEntity):
+            raise TypeError('text entities cannot be stored in a table')
+        return _view_class(cls)(self, row, *args, **kwargs)
+
+    def update(self, name, values, rows=slice(None)):
+        column = getattr(self, name)
+        if name == 'x':
+            values = np.clip(values, 0, disp_width - self.width[rows])
+        elif name == 'y':
+            values = np.clip(values, 0, disp_height - self.height[rows])
+        self.dirty[rows] |= column[rows] != values
+        column[rows] = values
+
+    def _header(self, message_type, entity_type):
+        key = message_type, entity_type
+        if key not in self._headers:
+            size = np.dtype(LAYOUTS[entity_type]).itemsize
+            header = bytes(vlq_pack(message_type) + vlq_pack(size))
+            self._headers[key] = header
+        return self._headers[key]
+
+    def _sizes(self, message_type, types):
+        sizes = np.zeros(len(types), np.int64)
+        for entity_type in np.unique(types):
+            entity_type = int(entity_type)
+            if entity_type not in LAYOUTS:
+                raise ValueError(f'unsupported entity type {entity_type}')
+            size = np.dtype(LAYOUTS[entity_type]).itemsize
+            header = self._header(message_type, entity_type)
+            sizes[types == entity_type] = len(header) + size
+        return sizes
+
+    """Encodes dirty rows in index order, rows past the byte budget stay
+    dirty"""
+    def encode(self, message_type, budget=None):
+        self.deferred = 0
+        self.bytes_deferred = 0
+        rows = np.flatnonzero(self.dirty)
+        if not len(rows):
+            return b''
+        types = self.type[rows]
+        if budget is not None:
+            sizes = self._sizes(message_type, types)
+            fits = np.cumsum(sizes) <= budget
+            self.deferred = int(np.count_nonzero(~fits))
+            self.bytes_deferred = int(sizes[~fits].sum())
+            rows = rows[fits]
+            types = types[fits]
+        self.dirty[rows] = False
+        out = bytearray()
+        for entity_type in np.unique(types):
+            entity_type = int(entity_type)
+            if entity_type not in LAYOUTS:
+                raise ValueError(f'unsupported entity type {entity_type}')
+            selected = rows[types == entity_type]
+            header = self._header(message_type, entity_type)
+            dtype = np.dtype([('header', 'u1', (len(header),))] +
+                             LAYOUTS[entity_type])
+            records = np.empty(len(selected), dtype)
+            records['header'] = np.frombuffer(header, np.uint8)
+            records['i'] = selected + self.offset
+            records['type'] = entity_type
+            if entity_type == SPRITE_ENTITY:
+                for name in ('index', 'tile', 'x', 'y', 'flags', 'scale_x',
+                             'scale_y', 'theta'):
+                    records[name] = getattr(self, name)[selected]
+                records['cx'] = self.cx[selected].astype(np.int64)
+                records['cy'] = self.cy[selected].astype(np.int64)
+            elif entity_type == RECTANGLE_ENTITY:
+                x, y = self.x[selected], self.y[selected]
+                records['xy'] = _pack12(x, y, x + self.width[selected],
+                                        y + self.height[selected])
+                records['color'] = self.color[selected]
+            elif entity_type == CIRCLE_ENTITY:
+                records['xy'] = _pack12(self.x[selected], self.y[selected])
+                records['radius'] = self.radius[selected].astype(np.int64)
+                records['color'] = self.color[selected]
+            out += records.tobytes()
+        return out
+
+
+# The entity constructor runs with column writes dropped, so it only sets
+# attributes that live outside the table and the row keeps its values.  An
+# unused row takes the type of the class it is viewed as.
+class RowView:
+    _binding = False
+
+    def __init__(self, table, row, *args, **kwargs):
+        self._table = table
+        self._row = row
+        self._binding = True
+        try:
+            super().__init__(*args, **kwargs)
+        finally:
+            self._binding = False
+        entity_type = self.__dict__.pop('_bound_type', SKIP_ENTITY)
+        if table.type[row] == SKIP_ENTITY and entity_type != SKIP_ENTITY:
+            table.type[row] = entity_type
+            table.dirty[row] = True
+
+    @property
+    def _dirty(self):
+        return bool(self._table.dirty[self._row])
+    @_dirty.setter
+    def _dirty(self, value):
+        if not self._binding:
+            self._table.dirty[self._row] = value
+
+def _column_property(name):
+    def getter(self):
+        return getattr(self._table, name)[self._row].item()
+    def setter(self, value):
+        if not self._binding:
+            getattr(self._table, name)[self._row] = value
+        elif name == 'type':
+            self._bound_type = value
+    return property(getter, setter)
+
+for _name in COLUMNS:
+    setattr(RowView, f'_{_name}', _column_property(_name))
+del _name
+
+_view_classes = {}
+
+def _view_class(cls):
+    if cls not in _view_classes:
+        _view_classes[cls] = type(f'{cls.__name__}View', (RowView, cls), {})
+    return _view_classes[cls]
@@ -1,32 +1,76 @@
-from bitstring import ConstBitStream
-from types import SimpleNamespace
+from struct import Struct
+
+BUTTON_A        = 1 << 15
+BUTTON_B        = 1 << 14
+BUTTON_Z        = 1 << 13
+BUTTON_START    = 1 << 12
+BUTTON_D_UP     = 1 << 11
+BUTTON_D_DOWN   = 1 << 10
+BUTTON_D_LEFT   = 1 << 9
+BUTTON_D_RIGHT  = 1 << 8
+BUTTON_Y        = 1 << 7
+BUTTON_X        = 1 << 6
+BUTTON_L        = 1 << 5
+BUTTON_R        = 1 << 4
+BUTTON_C_UP     = 1 << 3
+BUTTON_C_DOWN   = 1 << 2
+BUTTON_C_LEFT   = 1 << 1
+BUTTON_C_RIGHT  = 1 << 0
+BUTTONS_ALL     = 0xffff
+
+input_struct = Struct('>Hbbbbbb')
 
 def collision(a, b):
     return a.x0 <= b.x1 and a.x1 >= b.x0 and a.y0 <= b.y1 and a.y1 >= b.y0
 
-def decode_input(data):
-    bitstream = ConstBitStream(data)
-    namespace = SimpleNamespace()
-    namespace.a        = bitstream.read(1).u
-    namespace.b        = bitstream.read(1).u
-    namespace.z        = bitstream.read(1).u
-    namespace.start    = bitstream.read(1).u
-    namespace.d_up     = bitstream.read(1).u
-    namespace.d_down   = bitstream.read(1).u
-    namespace.d_left   = bitstream.read(1).u
-    namespace.d_right  = bitstream.read(1).u
-    namespace.y        = bitstream.read(1).u
-    namespace.x        = bitstream.read(1).u
-    namespace.l        = bitstream.read(1).u
-    namespace.r        = bitstream.read(1).u
-    namespace.c_up     = bitstream.read(1).u
-    namespace.c_down   = bitstream.read(1).u
-    namespace.c_left   = bitstream.read(1).u
-    namespace.c_right  = bitstream.read(1).u
-    namespace.stick_x  = bitstream.read(8).i
-    namespace.stick_y  = bitstream.read(8).i
-    namespace.cstick_x = bitstream.read(8).i
-    namespace.cstick_y = bitstream.read(8).i
-    namespace.analog_l = bitstream.read(8).i
-    namespace.analog_r = bitstream.read(8).i
-    return namespace
+def _button(mask):
+    return property(lambda self: int(bool(self.buttons & mask)))
+
+# Buttons are kept as one bitmask, along with the previous sample's, so edge
+# queries need neither a copy of the last record nor per-button compares.
+class Inputs:
+    __slots__ = ('buttons', 'previous', 'stick_x', 'stick_y', 'cstick_x',
+                 'cstick_y', 'analog_l', 'analog_r')
+
+    def __init__(self, buttons=0, stick_x=0, stick_y=0, cstick_x=0,
+                 cstick_y=0, analog_l=0, analog_r=0, previous=0):
+        self.buttons = buttons
+        self.previous = previous
+        self.stick_x = stick_x
+        self.stick_y = stick_y
+        self.cstick_x = cstick_x
+        self.cstick_y = cstick_y
+        self.analog_l = analog_l
+        self.analog_r = analog_r
+
+    def pressed(self, mask=BUTTONS_ALL):
+        return self.buttons & ~self.previous & mask
+
+    def released(self, mask=BUTTONS_ALL):
+        return ~self.buttons & self.previous & mask
+
+    def held(self, mask=BUTTONS_ALL):
+        return self.buttons & self.previous & mask
+
+    a       = _button(BUTTON_A)
+    b       = _button(BUTTON_B)
+    z       = _button(BUTTON_Z)
+    start   = _button(BUTTON_START)
+    d_up    = _button(BUTTON_D_UP)
+    d_down  = _button(BUTTON_D_DOWN)
+    d_left  = _button(BUTTON_D_LEFT)
+    d_right = _button(BUTTON_D_RIGHT)
+    y       = _button(BUTTON_Y)
+    x       = _button(BUTTON_X)
+    l       = _button(BUTTON_L)
+    r       = _button(BUTTON_R)
+    c_up    = _button(BUTTON_C_UP)
+    c_down  = _button(BUTTON_C_DOWN)
+    c_left  = _button(BUTTON_C_LEFT)
+    c_right = _button(BUTTON_C_RIGHT)
+
+def decode_input(data, previous=None):
+    inputs = Inputs(*input_struct.unpack_from(data))
+    if previous is not None:
+        inputs.previous = previous.buttons
+    return inputs
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import asyncio
+import importlib
+import traceback
+from multiprocessing import Process
+from time import perf_counter
+
+import click
+
+from .cart import SummerCart64
+from .game import FrameClock
+
+GAMES = {
+    'pong': 'terminal64.pong:Pong',
+    'sprite_demo': 'terminal64.sprite_demo:TileDemo',
+}
+
+def load_game(name):
+    module, _, cls = GAMES.get(name, name).partition(':')
+    return getattr(importlib.import_module(module), cls)
+
+# One clock steps every console.  A console whose USB writer is backed up
+# skips the frame rather than holding back the rest of the rack, and one
+# whose game raises is dropped so the others keep running.
+class Host:
+    def __init__(self, game_cls, ports, clock=None):
+        self.game_cls = game_cls
+        self.ports = list(ports)
+        self.clock = FrameClock() if clock is None else clock
+        self.games = {}
+        self.stalls = dict.fromkeys(self.ports, 0)
+        self.bytes_sent = dict.fromkeys(self.ports, 0)
+        self.errors = dict.fromkeys(self.ports, 0)
+        self.started = None
+
+    async def connect(self):
+        carts = await asyncio.gather(*(SummerCart64.connect(port)
+                                       for port in self.ports))
+        for port, cart in zip(self.ports, carts):
+            self.games[port] = self.game_cls(cart)
+
+    def stats(self):
+        elapsed = perf_counter() - self.started if self.started else 0.0
+        stats = {}
+        for port, game in self.games.items():
+            frames = game.stats['frames']
+            stats[port] = {
+                'frames': frames,
+                'stalls': self.stalls[port],
+                'errors': self.errors[port],
+                'frame_mean_seconds':
+                    game.stats['frame_seconds'] / frames if frames else 0.0,
+                'frame_max_seconds': game.stats['frame_max_seconds'],
+                'bytes_per_second':
+                    self.bytes_sent[port] / elapsed if elapsed else 0.0,
+                'usb_queue_depth': game.cart.stats['usb_queue_depth'],
+            }
+        return stats
+
+    def print_stats(self):
+        for port, stats in self.stats().items():
+            print(f'{port}: {stats["frames"]} frames, '
+                  f'{stats["stalls"]} stalls, '
+                  f'{stats["errors"]} errors, '
+                  f'{stats["frame_mean_seconds"] * 1000:.2f} ms mean, '
+                  f'{stats["frame_max_seconds"] * 1000:.2f} ms max, '
+                  f'{stats["bytes_per_second"] / 1024:.1f} KiB/s')
+        print(f'clock jitter {self.clock.jitter * 1000:.2f} ms')
+
+    async def run(self, stats_interval=None):
+        if not self.games:
+            await self.connect()
+        games = list(self.games.items())
+        self.started = perf_counter()
+        next_stats = stats_interval or 0
+        try:
+            for _, game in games:
+                game.start()
+            while games:
+                await self.clock.tick()
+                for port, game in list(games):
+                    if not game.cart.usb_writable.is_set():
+                        self.stalls[port] += 1
+                        continue
+                    try:
+                        game.step()
+                    except Exception:
+                        print(f'{port}: dropped after error')
+                        traceback.print_exc()
+                        self.errors[port] += 1
+                        games.remove((port, game))
+                        continue
+                    self.bytes_sent[port] += game.stats['bytes_sent']
+                elapsed = perf_counter() - self.started
+                if stats_interval and elapsed >= next_stats:
+                    self.print_stats()
+                    next_stats += stats_interval
+        except asyncio.CancelledError:
+            for _, game in games:
+                game.stop()
+
+def _worker(game, ports, rate, stats_interval):
+    host = Host(load_game(game), ports, FrameClock(rate))
+    try:
+        asyncio.run(host.run(stats_interval))
+    except KeyboardInterrupt:
+        pass
+
+@click.command
+@click.argument('game')
+@click.argument('uarts', nargs=-1, required=True)
+@click.option('--workers', default=1, help='processes to spread consoles over')
+@click.option('--rate', default=60, help='frames per second')
+@click.option('--stats', 'stats_interval', type=float,
+              help='print per console stats every N seconds')
+def main(game, uarts, workers, rate, stats_interval):
+    load_game(game)
+    workers = max(1, min(workers, len(uarts)))
+    if workers == 1:
+        _worker(game, uarts, rate, stats_interval)
+        return
+
+    processes = [Process(target=_worker,
+                         args=(game, uarts[i::workers], rate, stats_interval))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
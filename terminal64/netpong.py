@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import asyncio
-from copy import deepcopy
 
 import click
 
@@ -9,6 +8,7 @@ from terminal64.game.entity import CIRCLE_ENTITY, SKIP_ENTITY, TEXT_ENTITY
 
 from .cart import SummerCart64
 from .game import *
+from .game.util import BUTTON_START
 from .util import clamp
 
 
@@ -138,12 +138,10 @@ class Pong(Game, GameClient):
 
         player = self.state['player'][self.player_id]
 
-        if not self.last_inputs.start and inputs.start:
+        if inputs.pressed(BUTTON_START):
             player['ready'] = not player['ready']
 
         player['pos'] = clamp(inputs.stick_y / -72.0, -1.0, 1.0)
-
-        self.last_inputs = deepcopy(inputs)
         self.send_delta()
 
 async def amain(uart, host, port):
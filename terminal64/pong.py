@@ -66,7 +66,10 @@ class Pong(Game):
         self.score = Score()
         self.ball = Ball(4)
         self.paddle = [Paddle(0), Paddle(1)]
+        for entity in [self.score, self.ball] + self.paddle:
+            self.add_entity(entity)
         self.restart()
+        self.ready()
 
     def loop(self):
         self.paddle[1].pos = self.ball.y / 240 * 2 - 1
@@ -97,15 +100,10 @@ class Pong(Game):
         self.paddle[0].pos = pos
 
     def restart(self, winner=1):
-        self.reset()
-        self.entities = [self.score, self.ball] + self.paddle
-        for entity in self.entities:
-            entity._dirty = True
         self.ball.x = disp_width / 2 - self.ball.radius / 2
         self.ball.y = disp_height / 2 - self.ball.radius / 2
         self.delta_x = 3 if winner == 1 else -3
         self.delta_y = random.choice([3, -3])
-        self.ready()
 
 async def amain(uart):
     cart = await SummerCart64.connect(uart)
@@ -1,10 +1,16 @@
 import asyncio
 import json
+import socket
 from copy import deepcopy
 
-from json_delta import diff, patch
+from json_delta import patch
 
 from ..game import disp_height, disp_width
+from .state import State
+from .ticker import ticker
+
+WRITE_HIGH_WATER = 64 * 1024
+WRITE_LOW_WATER = 16 * 1024
 
 
 class GameFullException(Exception):
@@ -14,29 +20,63 @@ class InvalidMessage(Exception):
     pass
 
 class ServerGame:
-    instances = []
+    instances = {}
+    tick_rate = 60
+    idle_tick_rate = 4
 
     def __init__(self):
         self.player = {}
-        self.state = {}
-        self.last_state = {}
-        loop = asyncio.get_event_loop()
-        loop.create_task(self._loop())
-
-    async def _loop(self):
-        self.instances.append(self)
-        self.setup()
+        self._state = State()
         self.shutdown = False
-        while not self.shutdown:
-            if self.state != self.last_state:
-                delta = diff(self.last_state, self.state, verbose=False)
-                data = json.dumps(delta, separators=(',', ':'))
-                for player in self.player.values():
-                    player.write_line(f'delta {data}')
-                self.last_state = deepcopy(self.state)
-            await asyncio.sleep(1/60)
+        self._started = False
+        self._idle = False
+        self.instances[self] = None
+        ticker.add(self)
+
+    @property
+    def state(self):
+        return self._state
+    @state.setter
+    def state(self, value):
+        if value is not self._state:
+            self._state.assign(value)
+
+    # An idle game ticks at idle_tick_rate, a join or a client delta puts it
+    # back on tick_rate for its next tick.
+    @property
+    def idle(self):
+        return self._idle
+    @idle.setter
+    def idle(self, value):
+        self._idle = bool(value)
+        ticker.set_rate(self, self.idle_tick_rate if value else self.tick_rate)
+
+    def wake(self):
+        if self._idle:
+            self.idle = False
+
+    def _tick(self):
+        if not self._started:
+            self._started = True
+            self.setup()
+        else:
             self.loop()
-        self.instances.remove(self)
+
+        frame = None
+        if self._state.changed:
+            delta = self._state.delta()
+            data = json.dumps(delta, separators=(',', ':'))
+            # every recipient gets the same bytes object
+            frame = f'delta {data}\n'.encode()
+        for player in self.player.values():
+            if player.resync:
+                self._send_state(player)
+            elif frame is not None:
+                player.write_delta(frame)
+
+        if self.shutdown and not self.player:
+            ticker.remove(self)
+            self.instances.pop(self, None)
 
     def _join(self, client):
         for player_id in range(self.max_players):
@@ -47,10 +87,14 @@ class ServerGame:
         else:
             raise GameFullException
 
+        self.wake()
         self.join(client.player_id)
+        self._send_state(client)
 
+    def _send_state(self, client):
         data = json.dumps(self.state, separators=(',', ':'))
         client.write_line(f'state {client.player_id} {data}')
+        client.resync = False
 
     def _leave(self, client):
         try:
@@ -58,13 +102,15 @@ class ServerGame:
         except ValueError:
             return
 
+        self.wake()
         self.leave(client.player_id)
 
         if len(self.player) == 0:
             self.shutdown = True
 
     def _patch(self, client, diff):
-        before = self.state['player'][client.player_id]
+        self.wake()
+        before = deepcopy(self.state['player'][client.player_id])
         after = patch(before, diff, False)
         self.state['player'][client.player_id] = after
         self.patch(before, after)
@@ -91,11 +137,23 @@ class GameProtocol(asyncio.Protocol):
         self._buffer = bytearray()
         self._game = None
         self._transport = None
+        self._frames = []
+        self.backlogged = False
+        self.resync = False
+        self.stats = {
+            'deltas_dropped': 0,
+            'snapshots': 0,
+        }
 
     def connection_made(self, transport):
         peername = transport.get_extra_info('peername')
         print(f'Connection from: {peername}')
         self._transport = transport
+        transport.set_write_buffer_limits(WRITE_HIGH_WATER, WRITE_LOW_WATER)
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET,
+                                                socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def connection_lost(self, exc):
         peername = self._transport.get_extra_info('peername')
@@ -120,7 +178,42 @@ class GameProtocol(asyncio.Protocol):
             self.line_received(line.decode().strip())
 
     def write_line(self, line):
-        self._transport.write(f'{line}\n'.encode())
+        self.write_frame(f'{line}\n'.encode())
+
+    """Frames queued during one pass of the event loop go out as one write"""
+    def write_frame(self, frame):
+        if not self._frames:
+            asyncio.get_event_loop().call_soon(self._flush)
+        self._frames.append(frame)
+
+    # A client that stops reading gets no more deltas.  Once its buffer has
+    # drained, the game sends it one state snapshot on its next tick instead
+    # of the deltas it missed.
+    def pause_writing(self):
+        self.backlogged = True
+
+    def resume_writing(self):
+        self.backlogged = False
+        self.resync = True
+        self.stats['snapshots'] += 1
+        if self._game is not None:
+            self._game.wake()
+
+    def write_delta(self, frame):
+        if self.backlogged or self.resync:
+            self.stats['deltas_dropped'] += 1
+            return
+        self.write_frame(frame)
+
+    def _flush(self):
+        frames = self._frames
+        self._frames = []
+        if self._transport.is_closing():
+            return
+        if len(frames) == 1:
+            self._transport.write(frames[0])
+        else:
+            self._transport.write(b''.join(frames))
 
     def line_received(self, line: str):
         args = line.split()
@@ -185,8 +278,8 @@ async def async_main():
     loop = asyncio.get_event_loop()
     server = await loop.create_server(GameProtocol, '0.0.0.0', 7890)
 
-    for socket in server.sockets:
-        print(f'Server listening: {socket.getsockname()}')
+    for sock in server.sockets:
+        print(f'Server listening: {sock.getsockname()}')
 
     async with server:
         await server.serve_forever()
@@ -131,6 +131,7 @@ class PongGame(ServerGame):
 
         self.state['ball'] = self.ball.state
 
+        self.idle = ready < 2
         if ready < 2:
             return
 
@@ -0,0 +1,242 @@
+from copy import deepcopy
+
+# Containers know their path from the root and report every assignment to
+# it, so a delta is built from the changed paths alone.  Assigning a plain
+# dict over a tracked one, or a list over a list of the same length, updates
+# it key by key and only records what differs.  Structural list changes
+# record the whole list.
+#
+# Assigned dicts and lists are stored as tracked copies, the caller's object
+# is not aliased: later changes to it are not seen, change the state itself.
+
+def _track(root, path, value):
+    if isinstance(value, dict):
+        tracked = TrackedDict()
+        tracked._root = root
+        tracked._path = path
+        for key, item in value.items():
+            dict.__setitem__(tracked, key, _track(root, path + (key,), item))
+        return tracked
+    if isinstance(value, list):
+        tracked = TrackedList()
+        tracked._root = root
+        tracked._path = path
+        list.extend(tracked, [_track(root, path + (i,), item)
+                              for i, item in enumerate(value)])
+        return tracked
+    return value
+
+def _repath(value, path):
+    if isinstance(value, TrackedDict):
+        value._path = path
+        for key, item in value.items():
+            _repath(item, path + (key,))
+    elif isinstance(value, TrackedList):
+        value._path = path
+        for i, item in enumerate(value):
+            _repath(item, path + (i,))
+
+def _detach(value):
+    if isinstance(value, (TrackedDict, TrackedList)):
+        value._root = None
+        for item in (value.values() if isinstance(value, dict) else value):
+            _detach(item)
+
+def _same(old, new):
+    return type(old) is type(new) and old == new
+
+def _merge(old, new):
+    if old is new:
+        return True
+    if isinstance(old, TrackedDict) and isinstance(new, dict):
+        for key in [key for key in old if key not in new]:
+            del old[key]
+        for key, value in new.items():
+            old[key] = value
+        return True
+    if (isinstance(old, TrackedList) and isinstance(new, list) and
+            len(old) == len(new)):
+        for i, value in enumerate(new):
+            old[i] = value
+        return True
+    return False
+
+class TrackedDict(dict):
+    __slots__ = ('_root', '_path')
+
+    def _changed(self, key, existed=True):
+        if self._root is not None:
+            self._root._record(self._path + (key,), existed)
+
+    def __setitem__(self, key, value):
+        existed = key in self
+        if existed:
+            old = dict.__getitem__(self, key)
+            if _merge(old, value) or _same(old, value):
+                return
+            _detach(old)
+        dict.__setitem__(self, key, _track(self._root, self._path + (key,),
+                                           value))
+        self._changed(key, existed)
+
+    def __delitem__(self, key):
+        _detach(dict.__getitem__(self, key))
+        dict.__delitem__(self, key)
+        self._changed(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = dict.__getitem__(self, key)
+        del self[key]
+        return value
+
+    def popitem(self):
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def __deepcopy__(self, memo):
+        return {key: deepcopy(value, memo) for key, value in self.items()}
+
+class TrackedList(list):
+    __slots__ = ('_root', '_path')
+
+    def _changed(self):
+        if self._root is None:
+            return
+        for i, item in enumerate(self):
+            path = self._path + (i,)
+            if isinstance(item, (TrackedDict, TrackedList)):
+                if item._root is self._root:
+                    _repath(item, path)
+                    continue
+            list.__setitem__(self, i, _track(self._root, path, item))
+        self._root._record(self._path)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            list.__setitem__(self, index, value)
+            self._changed()
+            return
+        old = list.__getitem__(self, index)
+        if _merge(old, value) or _same(old, value):
+            return
+        _detach(old)
+        index = range(len(self))[index]
+        list.__setitem__(self, index, _track(self._root, self._path + (index,),
+                                             value))
+        if self._root is not None:
+            self._root._record(self._path + (index,))
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, count):
+        list.__imul__(self, count)
+        self._changed()
+        return self
+
+    def append(self, value):
+        list.append(self, value)
+        self._changed()
+
+    def extend(self, values):
+        list.extend(self, values)
+        self._changed()
+
+    def insert(self, index, value):
+        list.insert(self, index, value)
+        self._changed()
+
+    def pop(self, index=-1):
+        value = list.pop(self, index)
+        _detach(value)
+        self._changed()
+        return value
+
+    def remove(self, value):
+        list.remove(self, value)
+        self._changed()
+
+    def clear(self):
+        list.clear(self)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(value, memo) for value in self]
+
+class State(TrackedDict):
+    __slots__ = ('_changes',)
+
+    def __init__(self, value=None):
+        super().__init__()
+        self._root = self
+        self._path = ()
+        self._changes = {}
+        if value:
+            self.update(value)
+
+    def assign(self, value):
+        _merge(self, value)
+
+    """Keeps whether the path existed when it first changed, a key both
+    added and removed since the last delta is left out"""
+    def _record(self, path, existed=True):
+        self._changes.setdefault(path, existed)
+
+    @property
+    def changed(self):
+        return bool(self._changes)
+
+    def _get(self, path):
+        value = self
+        for key in path:
+            if isinstance(value, dict) and key not in value:
+                return False, None
+            value = value[key]
+        return True, value
+
+    """Returns the changes since the last call as a json_delta diff, values
+    are live references into the state"""
+    def delta(self):
+        existed = self._changes
+        paths = sorted(existed, key=len)
+        self._changes = {}
+        covered = set()
+        stanzas = []
+        for path in paths:
+            if any(path[:i] in covered for i in range(len(path))):
+                continue
+            covered.add(path)
+            exists, value = self._get(path)
+            if exists:
+                stanzas.append([list(path), value])
+            elif existed[path]:
+                stanzas.append([list(path)])
+        return stanzas
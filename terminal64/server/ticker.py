@@ -0,0 +1,126 @@
+import asyncio
+import traceback
+from time import perf_counter
+
+from ..util import wake_future
+
+TICK_BATCH_SIZE = 64
+
+class TickGroup:
+    def __init__(self, rate, deadline):
+        self.rate = rate
+        self.period = 1 / rate
+        self.deadline = deadline
+        self.instances = {}
+        self.skipped = 0
+
+# One task ticks every registered instance.  Instances are grouped by tick
+# rate and each group runs off its own absolute deadline, so phases do not
+# drift with compute time.  Between batches of instances the task yields to
+# let connections make progress.
+class TickScheduler:
+    def __init__(self, batch_size=TICK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.groups = {}
+        self._task = None
+        self._waiter = None
+
+    def __len__(self):
+        return sum(len(group.instances) for group in self.groups.values())
+
+    def add(self, instance, rate=None):
+        if rate is None:
+            rate = instance.tick_rate
+        group = self.groups.get(rate)
+        if group is None:
+            loop = asyncio.get_event_loop()
+            group = TickGroup(rate, loop.time() + 1 / rate)
+            self.groups[rate] = group
+            # the new deadline may come before the one being waited for
+            if self._waiter is not None:
+                wake_future(self._waiter)
+        group.instances[instance] = None
+        instance._tick_group = group
+        if not hasattr(instance, 'tick_stats'):
+            instance.tick_stats = {
+                'ticks': 0,
+                'tick_seconds': 0.0,
+                'lag_seconds': 0.0,
+                'lag_max_seconds': 0.0,
+                'overruns': 0,
+            }
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def remove(self, instance):
+        group = getattr(instance, '_tick_group', None)
+        if group is not None:
+            group.instances.pop(instance, None)
+            instance._tick_group = None
+
+    def set_rate(self, instance, rate):
+        group = getattr(instance, '_tick_group', None)
+        if group is None or group.rate == rate:
+            return
+        self.remove(instance)
+        self.add(instance, rate)
+
+    def _tick(self, instance, deadline, period, now):
+        stats = instance.tick_stats
+        lag = now - deadline
+        stats['ticks'] += 1
+        stats['lag_seconds'] += lag
+        if lag > stats['lag_max_seconds']:
+            stats['lag_max_seconds'] = lag
+        if lag > period:
+            stats['overruns'] += 1
+        start = perf_counter()
+        try:
+            instance._tick()
+        except Exception:
+            traceback.print_exc()
+            self.remove(instance)
+            # no longer ticked, so it must not take new players either
+            instance.shutdown = True
+            instance.instances.pop(instance, None)
+        stats['tick_seconds'] += perf_counter() - start
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.groups:
+                deadline = min(group.deadline for group in self.groups.values())
+                if deadline > loop.time():
+                    self._waiter = loop.create_future()
+                    handle = loop.call_at(deadline, wake_future, self._waiter)
+                    try:
+                        await self._waiter
+                    finally:
+                        handle.cancel()
+                        self._waiter = None
+
+                for rate, group in list(self.groups.items()):
+                    if group.deadline > loop.time():
+                        continue
+                    if not group.instances:
+                        del self.groups[rate]
+                        continue
+                    instances = list(group.instances)
+                    for i, instance in enumerate(instances, 1):
+                        # removed while an earlier batch yielded
+                        if instance._tick_group is group:
+                            self._tick(instance, group.deadline, group.period,
+                                       loop.time())
+                        if i % self.batch_size == 0:
+                            await asyncio.sleep(0)
+
+                    group.deadline += group.period
+                    behind = loop.time() - group.deadline
+                    if behind >= group.period:
+                        missed = int(behind / group.period)
+                        group.deadline += missed * group.period
+                        group.skipped += missed
+        finally:
+            self._task = None
+
+ticker = TickScheduler()
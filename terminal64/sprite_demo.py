@@ -6,6 +6,7 @@ import random
 import click
 
 from . import Terminal64
+from .assets import AssetCache
 from .cart import SummerCart64
 from .game import *
 
@@ -36,8 +37,11 @@ class TilesEntity(SpriteEntity):
 
 class TileDemo(Game):
     def setup(self):
-        self.n64brew_sprite = Sprite('filesystem/n64brew.sprite')
-        self.tiles_sprite = Sprite('filesystem/tiles.sprite')
+        assets = AssetCache()
+        self.n64brew_sprite = Sprite(assets.build('assets/n64brew.png',
+                                                  tiles=(64, 96)))
+        self.tiles_sprite = Sprite(assets.build('assets/tiles.png',
+                                                tiles=(32, 32)))
         self.sprites = [self.n64brew_sprite, self.tiles_sprite]
 
         self.n64brew_entity = N64BrewEntity()
@@ -1,30 +1,105 @@
-__all__ = ['clamp', 'vlq_pack', 'vlq_unpack']
+__all__ = ['clamp', 'vlq_pack', 'vlq_pack_into', 'vlq_pack_many_into',
+           'vlq_size', 'vlq_unpack', 'vlq_unpack_from', 'vlq_unpack_many_from',
+           'wake_future']
+
+VLQ_MAX_LENGTH = 5
+VLQ_TABLE_SIZE = 1 << 14
 
 def clamp(value, min_, max_):
     return min(max_, max(min_, value))
 
-def vlq_pack(value):
-    data = bytearray()
-    while len(data) < 5:
-        byte = value & 0x7f
-        data.insert(0, byte)
+"""Completes a future unless it already is, safe to use as a timer callback"""
+def wake_future(future):
+    if not future.done():
+        future.set_result(None)
+
+def _vlq_encode(value):
+    if value < 0:
+        raise OverflowError
+    data = bytearray((value & 0x7f,))
+    value >>= 7
+    while value:
+        if len(data) >= VLQ_MAX_LENGTH:
+            raise OverflowError
+        data.append(0x80 | (value & 0x7f))
         value >>= 7
-        if not value:
-            for i in range(len(data) - 1):
-                data[i] |= 0x80
-            return data
+    data.reverse()
+    return bytes(data)
+
+# Every value below VLQ_TABLE_SIZE encodes to one or two bytes
+_vlq_table = [_vlq_encode(value) for value in range(VLQ_TABLE_SIZE)]
+
+def vlq_pack(value):
+    if 0 <= value < VLQ_TABLE_SIZE:
+        return bytearray(_vlq_table[value])
+    return bytearray(_vlq_encode(value))
+
+"""Writes value at offset, a bytearray grows when offset is at its end.
+Returns the offset following the value"""
+def vlq_pack_into(buffer, offset, value):
+    if 0 <= value < VLQ_TABLE_SIZE:
+        data = _vlq_table[value]
     else:
+        data = _vlq_encode(value)
+    if offset == len(buffer):
+        buffer += data
+        return len(buffer)
+    end = offset + len(data)
+    buffer[offset:end] = data
+    return end
+
+def vlq_pack_many_into(buffer, offset, values):
+    table = _vlq_table
+    data = b''.join([table[value] if 0 <= value < VLQ_TABLE_SIZE
+                     else _vlq_encode(value) for value in values])
+    if offset == len(buffer):
+        buffer += data
+        return len(buffer)
+    end = offset + len(data)
+    buffer[offset:end] = data
+    return end
+
+def vlq_size(value):
+    size = 1
+    while value >> 7 and size < VLQ_MAX_LENGTH:
+        value >>= 7
+        size += 1
+    if value >> 7:
         raise OverflowError
+    return size
 
-def vlq_unpack(data):
-    value = 0
-    length = 0
-    for byte in data:
-        value |= byte & 0x7f
-        length += 1
-        if not byte & 0x80:
-            return value, length
-        if length >= 5:
-            raise OverflowError
-        value <<= 7
+"""Returns the value at offset and the offset following it"""
+def vlq_unpack_from(data, offset=0):
+    byte = data[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    value = byte & 0x7f
+    if offset + 1 < len(data):
+        byte = data[offset + 1]
+        if byte < 0x80:
+            return (value << 7) | byte, offset + 2
+    end = min(offset + VLQ_MAX_LENGTH, len(data))
+    for i in range(offset + 1, end):
+        byte = data[i]
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, i + 1
+    if end - offset >= VLQ_MAX_LENGTH:
+        raise OverflowError
     raise IndexError
+
+def vlq_unpack_many_from(data, offset, count):
+    values = []
+    append = values.append
+    for _ in range(count):
+        byte = data[offset]
+        if byte < 0x80:
+            append(byte)
+            offset += 1
+        else:
+            value, offset = vlq_unpack_from(data, offset)
+            append(value)
+    return values, offset
+
+def vlq_unpack(data):
+    return vlq_unpack_from(data)
@@ -0,0 +1,84 @@
+import pytest
+
+from terminal64.game.encoder import Encoder
+from terminal64.game.entity import (CircleEntity, Entity, RectangleEntity,
+                                    SpriteEntity, TextEntity)
+
+# Messages produced by the bitstring encoder these replaced
+GOLDEN = {
+    'sprite':       '01020103074a405a420108103e003a004248',
+    'rectangle':    '000302011021075049f801',
+    'circle':       '00280309605a0c07c1',
+    'text':         '0005044400480004001000003f686900',
+    'skip':         '000700',
+}
+
+def sprite():
+    entity = SpriteEntity()
+    entity.index = 3
+    entity.tile = 7
+    entity.x = 12.5
+    entity.y = 200.25
+    entity._flags = 1
+    entity.cx = 8
+    entity.cy = 16
+    entity.scale_x = 1.5
+    entity.scale_y = 0.75
+    entity.theta = 3.140625
+    return entity.message(0x102)
+
+def rectangle():
+    entity = RectangleEntity()
+    entity.x = 17
+    entity.y = 33
+    entity.width = 100
+    entity.height = 40
+    entity.color = (255, 0, 0)
+    return entity.message(3)
+
+def circle():
+    entity = CircleEntity()
+    entity.x = 150
+    entity.y = 90
+    entity.radius = 12
+    entity.color = (0, 255, 0, 128)
+    return entity.message(40)
+
+def text():
+    entity = TextEntity('hi')
+    entity.x = 4
+    entity.y = 8
+    entity.width = 64
+    entity.height = 16
+    entity.color = (0, 0, 255)
+    return entity.message(5)
+
+def skip():
+    return Entity().message(7)
+
+@pytest.mark.parametrize('name, message', [
+    ('sprite', sprite),
+    ('rectangle', rectangle),
+    ('circle', circle),
+    ('text', text),
+    ('skip', skip),
+])
+def test_entity_message(name, message):
+    assert message().hex() == GOLDEN[name]
+
+def test_pack_into_matches_pack():
+    encoder = Encoder('u16', 'u8', 'u12', 'u12', 'u12', 'u12', 'u16')
+    values = (3, 2, 17, 33, 117, 73, 0xf801)
+    buffer = bytearray(encoder.size + 2)
+    assert encoder.pack_into(buffer, 2, *values) == len(buffer)
+    assert bytes(buffer[2:]) == encoder.pack(*values)
+
+@pytest.mark.parametrize('value', [-1, 0x1000])
+def test_u12_out_of_range(value):
+    encoder = Encoder('u8', 'u12', 'u12')
+    with pytest.raises(ValueError):
+        encoder.pack(0, 1, value)
+
+def test_unaligned_bit_fields():
+    with pytest.raises(ValueError):
+        Encoder('u12', 'u16')
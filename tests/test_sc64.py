@@ -0,0 +1,64 @@
+import asyncio
+from unittest import mock
+
+from terminal64.cart.sc64 import (USB_MERGE_SIZE, USB_QUEUE_LOW_WATER,
+                                  USB_QUEUE_SIZE, SummerCart64, pkt_header)
+
+def connect():
+    cart = SummerCart64()
+    cart.transport = mock.Mock()
+    return cart
+
+def respond(cart, pkt_id, data):
+    cart.data_received(pkt_header.pack(b'CMP', ord(pkt_id), len(data)) + data)
+
+async def command(cart, pkt_id, reply):
+    task = asyncio.create_task(cart.send_cmd(pkt_id, timeout=0.05))
+    await asyncio.sleep(0)
+    if reply is not None:
+        respond(cart, pkt_id, reply)
+    return await task
+
+def test_responses_in_order():
+    async def main():
+        cart = connect()
+        tasks = [asyncio.create_task(cart.send_cmd('v')) for _ in range(3)]
+        await asyncio.sleep(0)
+        for i in range(3):
+            respond(cart, 'v', bytes((i,)))
+        return await asyncio.gather(*tasks), cart.outstanding
+    results, outstanding = asyncio.run(main())
+    assert results == [(True, bytes((i,))) for i in range(3)]
+    assert outstanding == 0
+
+def test_lost_response():
+    async def main():
+        cart = connect()
+        lost = await command(cart, 'v', None)
+        results = [await command(cart, 'v', bytes((i,))) for i in range(3)]
+        return lost, results, cart.outstanding
+    lost, results, outstanding = asyncio.run(main())
+    assert lost[0] is None
+    assert results == [(True, bytes((i,))) for i in range(3)]
+    assert outstanding == 0
+
+def test_usb_backpressure():
+    async def main():
+        cart = connect()
+        cart.pause_writing()
+        chunk = bytes(USB_MERGE_SIZE // 4)
+        for _ in range(4 * (USB_QUEUE_SIZE + 2)):
+            cart.send_usb_cmd(0xff, chunk, merge=True)
+        sizes = [len(data) for _, data, _ in cart._usb_queue]
+        blocked = not cart.usb_writable.is_set()
+
+        drained = asyncio.create_task(cart.drain_usb())
+        cart.resume_writing()
+        while not drained.done():
+            await asyncio.sleep(0)
+        return sizes, blocked, len(cart._usb_queue)
+    sizes, blocked, depth = asyncio.run(main())
+    assert max(sizes) <= USB_MERGE_SIZE
+    assert len(sizes) == USB_QUEUE_SIZE + 2
+    assert blocked
+    assert depth <= USB_QUEUE_LOW_WATER
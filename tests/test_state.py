@@ -0,0 +1,64 @@
+from copy import deepcopy
+
+import json_delta
+
+from terminal64.server.state import State
+
+def check(state, change):
+    before = deepcopy(state)
+    change(state)
+    delta = state.delta()
+    after = json_delta.patch(deepcopy(before), deepcopy(delta), False)
+    assert after == deepcopy(state)
+    assert not state.changed
+    return delta
+
+def initial():
+    state = State({
+        'ball': {'x': 1, 'y': 2, 'v': {'x': 3, 'y': 4}},
+        'player': [{'score': 0}, {'score': 0}],
+        'log': [1, 2, 3],
+    })
+    state.delta()
+    return state
+
+def test_nested_dict_merge():
+    def change(state):
+        state['ball'] = {'x': 5, 'y': 2, 'v': {'x': 3, 'y': -4}}
+    delta = check(initial(), change)
+    assert sorted(delta) == [[['ball', 'v', 'y'], -4], [['ball', 'x'], 5]]
+
+def test_list_append_pop_assign():
+    def change(state):
+        state['log'].append(4)
+        state['log'].pop(0)
+        state['player'][1]['score'] = 2
+        state['player'][0] = {'score': 1, 'ready': True}
+    check(initial(), change)
+
+def test_replace_container():
+    def change(state):
+        state['ball']['v'] = [1, 2]
+        state['log'] = {'first': 1}
+        state['player'] = [{'score': 9}]
+    check(initial(), change)
+
+def test_added_then_deleted():
+    def change(state):
+        state['extra'] = {'a': 1}
+        state['ball']['z'] = 0
+        del state['extra']
+        del state['ball']['z']
+    assert check(initial(), change) == []
+
+def test_delete_existing():
+    def change(state):
+        del state['ball']['v']
+        state.pop('log')
+    check(initial(), change)
+
+def test_unchanged_assignment():
+    def change(state):
+        state['ball']['x'] = 1
+        state['log'] = [1, 2, 3]
+    assert check(initial(), change) == []
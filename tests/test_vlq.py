@@ -0,0 +1,65 @@
+import pytest
+
+from terminal64.util import (vlq_pack, vlq_pack_into, vlq_pack_many_into,
+                             vlq_size, vlq_unpack, vlq_unpack_from,
+                             vlq_unpack_many_from)
+
+# (value, encoded length) either side of each length boundary
+BOUNDARIES = [
+    (0, 1), (0x7f, 1),
+    (0x80, 2), (0x3fff, 2),
+    (0x4000, 3), (0x1fffff, 3),
+    (0x200000, 4), (0xfffffff, 4),
+    (0x10000000, 5), (0x7ffffffff, 5),
+]
+
+@pytest.mark.parametrize('value, length', BOUNDARIES)
+def test_round_trip(value, length):
+    data = vlq_pack(value)
+    assert len(data) == length
+    assert vlq_size(value) == length
+    assert vlq_unpack(data) == (value, length)
+    assert vlq_unpack_from(b'\xff' + data, 1) == (value, length + 1)
+
+    buffer = bytearray(b'\xaa' * (length + 2))
+    assert vlq_pack_into(buffer, 1, value) == length + 1
+    assert buffer[1:length + 1] == data
+    assert buffer[0] == buffer[-1] == 0xaa
+
+    buffer = bytearray()
+    assert vlq_pack_into(buffer, 0, value) == length
+    assert buffer == data
+
+def test_many_round_trip():
+    values = [value for value, _ in BOUNDARIES]
+    buffer = bytearray(b'\xaa')
+    end = vlq_pack_many_into(buffer, 1, values)
+    assert end == len(buffer) == 1 + sum(length for _, length in BOUNDARIES)
+    assert buffer[1:] == b''.join(vlq_pack(value) for value in values)
+    assert vlq_unpack_many_from(buffer, 1, len(values)) == (values, end)
+
+@pytest.mark.parametrize('value, length', BOUNDARIES[2:])
+def test_truncated(value, length):
+    data = vlq_pack(value)
+    for cut in range(1, length):
+        with pytest.raises(IndexError):
+            vlq_unpack_from(data[:cut])
+        with pytest.raises(IndexError):
+            vlq_unpack_many_from(data[:cut], 0, 1)
+
+@pytest.mark.parametrize('value', [0x800000000, -1])
+def test_oversized(value):
+    with pytest.raises(OverflowError):
+        vlq_pack(value)
+    with pytest.raises(OverflowError):
+        vlq_pack_into(bytearray(), 0, value)
+    with pytest.raises(OverflowError):
+        vlq_pack_many_into(bytearray(), 0, [1, value])
+
+def test_oversized_size():
+    with pytest.raises(OverflowError):
+        vlq_size(0x800000000)
+
+def test_oversized_unpack():
+    with pytest.raises(OverflowError):
+        vlq_unpack_from(b'\x80' * 5 + b'\x00')
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import random
+import time
+
+from terminal64 import USB_MESSAGES
+from terminal64.cart import SummerCart64
+from terminal64.util import vlq_pack
+
+
+class SimulatedTransport:
+    def write(self, data):
+        pass
+
+def usb_packet(payload):
+    data = USB_MESSAGES.to_bytes(1) + len(payload).to_bytes(3) + payload
+    return b'PKTU' + len(data).to_bytes(4) + data
+
+def frame(packets):
+    input = vlq_pack(0) + vlq_pack(8) + bytes(8)
+    return b''.join(usb_packet(input * random.randint(1, 4))
+                    for _ in range(packets))
+
+def main(frames=600, packets=128):
+    cart = SummerCart64()
+    cart.transport = SimulatedTransport()
+    received = 0
+    def recv_usb_pkt(pkt_type, data):
+        nonlocal received
+        received += 1
+    cart.recv_usb_pkt = recv_usb_pkt
+
+    data = [frame(packets) for _ in range(frames)]
+    total = sum(len(chunk) for chunk in data)
+    start = time.perf_counter()
+    for chunk in data:
+        # serial reads rarely line up with packet boundaries
+        offset = 0
+        while offset < len(chunk):
+            size = random.randint(1, 4096)
+            cart.data_received(chunk[offset:offset + size])
+            offset += size
+    elapsed = time.perf_counter() - start
+
+    assert received == frames * packets
+    print(f'{received} packets, {total} bytes in {elapsed * 1000:.1f} ms')
+    print(f'{received / elapsed:,.0f} packets/s, '
+          f'{total / elapsed / 1e6:.1f} MB/s, '
+          f'{cart.stats["compactions"]} compactions')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import random
+import timeit
+
+from terminal64.util import (vlq_pack, vlq_pack_into, vlq_pack_many_into,
+                             vlq_unpack, vlq_unpack_from, vlq_unpack_many_from)
+
+
+def legacy_pack(value):
+    data = bytearray()
+    while len(data) < 5:
+        byte = value & 0x7f
+        data.insert(0, byte)
+        value >>= 7
+        if not value:
+            for i in range(len(data) - 1):
+                data[i] |= 0x80
+            return data
+    else:
+        raise OverflowError
+
+def legacy_unpack(data):
+    value = 0
+    length = 0
+    for byte in data:
+        value |= byte & 0x7f
+        length += 1
+        if not byte & 0x80:
+            return value, length
+        if length >= 5:
+            raise OverflowError
+        value <<= 7
+    raise IndexError
+
+# Message headers as the USB path sees them: small types, mostly short
+# lengths with the occasional sprite chunk
+headers = []
+for _ in range(1000):
+    headers.append(random.randrange(8))
+    headers.append(random.choice((3, 11, 13, 20, 2064, 4000)))
+
+def bench_legacy_pack():
+    buffer = bytearray()
+    for value in headers:
+        buffer.extend(legacy_pack(value))
+    return buffer
+
+def bench_pack():
+    buffer = bytearray()
+    for value in headers:
+        buffer.extend(vlq_pack(value))
+    return buffer
+
+def bench_pack_into():
+    buffer = bytearray()
+    offset = 0
+    for value in headers:
+        offset = vlq_pack_into(buffer, offset, value)
+    return buffer
+
+def bench_pack_many_into():
+    buffer = bytearray()
+    vlq_pack_many_into(buffer, 0, headers)
+    return buffer
+
+encoded = bytes(bench_legacy_pack())
+
+def bench_legacy_unpack():
+    data = bytearray(encoded)
+    values = []
+    while data:
+        value, length = legacy_unpack(data)
+        del data[:length]
+        values.append(value)
+    return values
+
+def bench_unpack():
+    data = bytearray(encoded)
+    values = []
+    while data:
+        value, length = vlq_unpack(data)
+        del data[:length]
+        values.append(value)
+    return values
+
+def bench_unpack_from():
+    data = memoryview(encoded)
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = vlq_unpack_from(data, offset)
+        values.append(value)
+    return values
+
+def bench_unpack_many_from():
+    values, _ = vlq_unpack_many_from(memoryview(encoded), 0, len(headers))
+    return values
+
+def main():
+    assert bench_pack() == bench_pack_into() == bench_pack_many_into() == \
+           bench_legacy_pack()
+    assert bench_unpack_from() == bench_unpack_many_from() == \
+           bench_legacy_unpack() == headers
+
+    for name in ('legacy_pack', 'pack', 'pack_into', 'pack_many_into',
+                 'legacy_unpack', 'unpack', 'unpack_from', 'unpack_many_from'):
+        func = globals()[f'bench_{name}']
+        number, total = timeit.Timer(func).autorange()
+        per_value = total / number / len(headers) * 1e9
+        print(f'{name:20} {per_value:8.1f} ns/value')
+
+if __name__ == '__main__':
+    main()